@@ -14,7 +14,7 @@ class Actor:
     male or female actor
 
     """
-    def __init__(self, gender='male', name='', node_id=0, store={}):
+    def __init__(self, gender='male', name='', node_id=0, store={}, rng=None):
         self.gender = gender
         self.name = name
         self.node_id = node_id
@@ -30,14 +30,14 @@ class Actor:
             'sport': '',
         }
         self.attribute_store = store.attribute_store
-        self.fill_attributes()
+        self.fill_attributes(rng if rng is not None else random)
 
-    def fill_attributes(self):
+    def fill_attributes(self, rng=random):
         for key,val in self.attribute_store.items():
-            random_val = random.choice(val['options'])
+            random_val = rng.choice(val['options'])
             random_attr = '[{}]'.format(random_val)
             name = '[{}]'.format(self.name)
-            random_placeholder = random.choice(val['placeholders'])
+            random_placeholder = rng.choice(val['placeholders'])
             text = random_placeholder.replace('e_x', name).replace('attr_x', random_attr) + ". "
             self.attributes[key] = text
 
@@ -7,15 +7,38 @@
 #
 """
 
-import numpy as np
 import names
-import copy
 import random
+import bisect
 from clutrr.actors.actor import Actor, Entity
 from clutrr.store.store import Store
 
 #store = Store()
 
+# cumulative name distributions of the names package, loaded once per process
+_NAME_DIST = {}
+
+
+def first_name(gender, rng):
+    """
+    Same distribution as ``names.get_first_name``, drawn from the given random stream
+    :param gender: male / female
+    :param rng: random.Random
+    :return: name
+    """
+    if gender not in _NAME_DIST:
+        all_names = []
+        cumulative = []
+        with open(names.FILES['first:{}'.format(gender)]) as name_file:
+            for line in name_file:
+                name, _, cum, _ = line.split()
+                all_names.append(name.capitalize())
+                cumulative.append(float(cum))
+        _NAME_DIST[gender] = (all_names, cumulative)
+    all_names, cumulative = _NAME_DIST[gender]
+    i = bisect.bisect_right(cumulative, rng.random() * 90)
+    return all_names[i] if i < len(all_names) else ''
+
 class Ancestry:
     """
     Ancestry of people to simulate
@@ -34,7 +57,8 @@ class Ancestry:
     - Relation keyword to be taken from rules_store
     """
     def __init__(self, args, store:Store,
-                 relationship_type={'SO':1,'child':2}, taken_names=None):
+                 relationship_type={'SO':1,'child':2}, taken_names=None, rng=None):
+        self.rng = rng if rng is not None else random.Random() # random stream of this ancestry
         self.family = {} # dict (node_id_a, node_id_b) : rel dict
         self.family_data = {} # dict to hold node_id details
         self.work_data = {} # dict to hold work location id details
@@ -47,7 +71,7 @@ class Ancestry:
         self.levels = 0 # keep track of the levels
         self.node_ct = 0
         self.flipped = [] # track of nodes which are gender flipped
-        self.taken_names = taken_names if taken_names else copy.deepcopy(self.store.attr_names) # keep track of names which are already taken
+        self.taken_names = taken_names if taken_names else set(self.store.attr_names) # keep track of names which are already taken
         self.simulate()
         #self.add_work_relations()
 
@@ -58,7 +82,7 @@ class Ancestry:
         :return:
         """
         self.node_ct = 0
-        self.levels = random.randint(1,self.max_levels)
+        self.levels = self.rng.randint(1,self.max_levels)
         # we are root, for now just add one head of family
         gender = 'male'
         nodes = self.add_members(gender=gender, num=1)
@@ -69,7 +93,7 @@ class Ancestry:
             generation_nodes = []
             for node in parents:
                 # marry with probability p_marry
-                decision_marry = np.random.choice([True,False],1,p=[self.p_marry, 1-self.p_marry])
+                decision_marry = self.rng.random() < self.p_marry
                 if decision_marry:
                     # add the partner
                     nodes =  self.add_members(gender=self.toggle_gender(node), num=1)
@@ -77,7 +101,7 @@ class Ancestry:
                     # always leave the last level as single children
                     if level != self.max_levels - 1:
                         # add the children for this parent
-                        num_childs = random.randint(self.min_child, self.max_child)
+                        num_childs = self.rng.randint(self.min_child, self.max_child)
                         child_nodes = self.add_members(num=num_childs)
                         if len(child_nodes) > 0:
                             for ch_node in child_nodes:
@@ -99,14 +123,14 @@ class Ancestry:
         added_nodes = []
         for x in range(num):
             if num > 1:
-                gender = random.choice(['male', 'female'])
+                gender = self.rng.choice(['male', 'female'])
             # select a name that is not taken
-            name = names.get_first_name(gender=gender)
+            name = first_name(gender, self.rng)
             while name in self.taken_names:
-                name = names.get_first_name(gender=gender)
+                name = first_name(gender, self.rng)
             self.taken_names.add(name)
             node = Actor(
-                name=name, gender=gender, node_id=node_id, store=self.store)
+                name=name, gender=gender, node_id=node_id, store=self.store, rng=self.rng)
             added_nodes.append(node)
             self.family_data[node_id] = node
             node_id += 1
@@ -153,7 +177,7 @@ class Ancestry:
             # reset flip
             self.flipped = []
         else:
-            node = random.choice(candidates)
+            node = self.rng.choice(candidates)
             relations_with_node = [node_pair for node_pair in self.family.keys() if node_pair[0] == node]
             SO_relation = [node_pair for node_pair in relations_with_node if self.family[node_pair]['family'] == 'SO']
             assert len(SO_relation) <= 1
@@ -177,7 +201,7 @@ class Ancestry:
                 # choose a new gender appropriate name
                 gender = self.family_data[node].gender
                 while name in self.taken_names:
-                    name = names.get_first_name(gender=gender)
+                    name = first_name(gender, self.rng)
                 self.family_data[node].name = name
                 self.flipped.append(node)
                 #print("flipping singles ...")
@@ -197,13 +221,13 @@ class Ancestry:
         """
         num_pop = len(self.family_data)
         pop_ids = self.family_data.keys()
-        work_locations = random.sample(self.store.attribute_store['work']['options'], int(num_pop * w))
+        work_locations = self.rng.sample(self.store.attribute_store['work']['options'], int(num_pop * w))
         node_ct = self.node_ct
         work_bins = {}
         pop_per_loc = num_pop // len(work_locations)
         for wl in work_locations:
             self.work_data[node_ct] = Entity(name=wl, etype='work')
-            w = random.sample(pop_ids, pop_per_loc)
+            w = self.rng.sample(pop_ids, pop_per_loc)
             pop_ids = list(set(pop_ids) - set(w))
             work_bins[wl] = {"id": node_ct, "w": w}
             node_ct+=1
@@ -221,7 +245,7 @@ class Ancestry:
                     self.family[edge]['work'] = []
                 self.family[edge]['work'].append('works_at')
             # select manager
-            manager = random.choice(pops)
+            manager = self.rng.choice(pops)
             for p in pops:
                 edge = (p, manager)
                 if edge not in self.family:
@@ -56,20 +56,80 @@ def get_args(command=None):
                         help="Make sure each pattern is equal. Warning: Time complexity of generation increases if this flag is set.")
     parser.add_argument("--analyze", default=False, action='store_true', help="Analyze generated files")
     parser.add_argument("--mturk", default=False, action='store_true', help='prepare data for mturk')
+    parser.add_argument("--unique_by", type=str, default='f_comb',
+                        help='With --mturk, comma separated keys of the groups to sample rows from: '
+                             'f_comb, relation_length and / or genders')
+    parser.add_argument("--unique_num", type=int, default=1, help='With --mturk, number of rows kept per group')
     parser.add_argument("--holdout", default=False, action='store_true', help='if true, then hold out unique patterns in the test set')
+    parser.add_argument("--split_by", type=str, default='order', choices=['order', 'hash'],
+                        help='Assign patterns to train / test in generation order, or by a keyed hash of the pattern '
+                             'and puzzle which gives the same split in every run and shard. The hash split targets a '
+                             'test share of the rows of test_rows / (train_rows + test_rows)')
+    parser.add_argument("--split_key", type=int, default=0, help='Key of the --split_by hash')
+    parser.add_argument("--dedup", type=str, default='', choices=['', 'story', 'graph'],
+                        help='Drop the puzzles generated twice in the run, in any task or split. story : same '
+                             'graph with the same names, graph : same graph up to the numbering of the entities, '
+                             'whatever the names')
+    parser.add_argument("--dedup_error_rate", type=float, default=1e-6,
+                        help='False positive rate of the --dedup Bloom filter, ie rate of unique puzzles dropped')
     parser.add_argument("--data_name", default='', type=str, help='Dataset name')
     parser.add_argument("--use_mturk_template", default=False, action='store_true', help='use the templating data for mturk')
     parser.add_argument("--template_length", type=int, default=2, help="Max Length of the template to substitute")
     parser.add_argument("--template_file", type=str, default="amt_placeholders_clean.json", help="location of placeholders")
+    parser.add_argument("--placeholder_path", type=str, default='',
+                        help='Placeholder zip or extracted folder to use instead of the cached download')
     parser.add_argument("--template_split", default=True, action='store_true', help='Split on template level')
     parser.add_argument("--combination_length", type=int, default=1, help="number of relations to combine together")
     parser.add_argument("--output_dir", type=str, default="data", help="output_dir")
     parser.add_argument("--store_full_puzzles", default=False, action='store_true',
-                        help='store the full puzzle data in puzzles.pkl file. Warning: may take considerable amount of disk space!')
+                        help='store the full puzzle data in a compact puzzles.clz archive, see utils/puzzle_archive.py')
     parser.add_argument("--unique_test_pattern", default=False, action='store_true', help="If true, have unique patterns generated in the first gen,  and then choose from it.")
+    parser.add_argument("--pattern_registry", type=str, default='',
+                        help='SQLite file recording the train / test patterns of each generated task. With '
+                             '--unique_test_pattern, test tasks without a train task of the same length in the run '
+                             'keep the test patterns recorded there')
+    parser.add_argument("--registry_name", type=str, default='',
+                        help='Dataset name the patterns are recorded under in --pattern_registry, default --data_name')
+    parser.add_argument("--stream", default=False, action='store_true',
+                        help='Render and write rows in batches while generating, instead of keeping all puzzles in memory')
+    parser.add_argument("--stream_batch", type=int, default=500, help='Number of rows per written batch in --stream mode')
+    parser.add_argument("--output_format", type=str, default='csv', choices=['csv', 'jsonl', 'parquet'],
+                        help='Format of the dataset files. jsonl and parquet (needs pyarrow) store the structured '
+                             'columns with native list / int types instead of python reprs')
+    parser.add_argument("--compression", type=str, default='',
+                        help='Compression of the dataset files: gzip for csv / jsonl, parquet codec for parquet '
+                             '(default snappy)')
+    parser.add_argument("--row_group_size", type=int, default=50000, help='Number of rows per parquet row group')
+    parser.add_argument("--tensor_export", default=False, action='store_true',
+                        help='Also export the story graphs as memory-mappable .npy arrays (CSR layout) in the '
+                             'tensors/ folder of the dataset')
+    parser.add_argument("--row_index", default=False, action='store_true',
+                        help='Write a <file>.idx sidecar of row offsets, ids and patterns for each dataset file, '
+                             'for random access with utils/reader.py (uncompressed csv / jsonl only)')
+    parser.add_argument("--write_queue", type=int, default=4,
+                        help='Number of row batches queued for the background writer thread, 0 to write in the main thread')
+    parser.add_argument("--workers", type=int, default=1,
+                        help='Number of worker processes generating puzzles, each with its own family tree')
+    parser.add_argument("--task_workers", type=int, default=1,
+                        help='Number of processes generating the task choices in parallel, not used with --stream / --workers')
+    parser.add_argument("--shards", type=int, default=4,
+                        help='Number of generation shards in --stream / --workers mode, 0 for one per worker. '
+                             'For a fixed --seed and --shards, the output does not depend on --workers')
+    parser.add_argument("--seed", type=int, default=None, help='Root random seed, makes the generated dataset reproducible')
+    parser.add_argument("--reuse", default=False, action='store_true',
+                        help='With --seed, return the dataset of the output dir generated with the same arguments, '
+                             'stores, placeholders and registry patterns instead of generating it again, if its '
+                             'files are intact. Flags which only change how the run is executed, eg --workers, are '
+                             'not compared')
+    parser.add_argument("--checkpoint", default=False, action='store_true',
+                        help='Periodically checkpoint the run in the output dir (implies --stream). '
+                             'Rerunning the same command resumes from the last checkpoint')
+    parser.add_argument("--checkpoint_interval", type=int, default=300, help='Min number of seconds between two checkpoints')
 
 
     if command:
-        return parser.parse_args(command.split(' '))
+        if isinstance(command, str):
+            command = command.split(' ')
+        return parser.parse_args(command)
     else:
         return parser.parse_args()
\ No newline at end of file
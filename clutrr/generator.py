@@ -11,22 +11,35 @@
 
 from clutrr.actors.ancestry import Ancestry
 from clutrr.relations.builder import RelationBuilder
+from clutrr.relations.renderer import PuzzleRenderer, ROW_COLUMNS
 from tqdm import tqdm
 import random
-import numpy as np
-import json
 import copy
+import multiprocessing as mp
 
 from clutrr.args import get_args
-from clutrr.store.store import Store
+from clutrr.store.store import get_store
+from clutrr.store.template_store import load_templates
 from clutrr.utils.utils import comb_indexes
-import pandas as pd
+from clutrr.utils.columnar import ColumnarRows
+from clutrr.utils.split import make_splitter
+from clutrr.utils.seeding import make_rng
+from clutrr.utils.dedup import puzzle_fingerprint
 from clutrr.relations.templator import *
 
 #store = Store()
 
-def generate_rows(args, store, task_name, split=0.8, prev_patterns=None):
-    # pre-flight checks
+# number of puzzles rendered together
+RENDER_BATCH = 1000
+# with --dedup, stop a task once this many batches in a row only held duplicates
+DEDUP_PATIENCE = 100
+
+def check_combination_length(args):
+    """
+    pre-flight checks
+    :param args:
+    :return: combination length to use
+    """
     combination_length = min(args.combination_length, args.relation_length)
     if not args.use_mturk_template:
         if combination_length > 1:
@@ -34,17 +47,35 @@ def generate_rows(args, store, task_name, split=0.8, prev_patterns=None):
     else:
         if combination_length > 3:
             raise NotImplementedError("combinations of > 3 not implemented in AMT Templating")
-    # generate
-    print(args.relation_length)
-    print("Loading templates...")
-    all_puzzles = {}
+    return combination_length
+
+
+def load_task_templates(args):
+    """
+    Load the AMT templates of the run
+    Templates are indexed once and memoized, calling this before forking workers shares them
+    :param args:
+    :return: train templates, test templates
+    """
     if args.template_split:
-        train_templates = json.load(open(args.template_file + '.train.json'))
-        test_templates = json.load(open(args.template_file + '.test.json'))
-    else:
-        train_templates = json.load(open(args.template_file + '.json'))
-        test_templates = json.load(open(args.template_file + '.json'))
+        return load_templates(args.template_file + '.train.json'), load_templates(args.template_file + '.test.json')
+    templates = load_templates(args.template_file + '.json')
+    return templates, templates
+
+
+def build_renderer(args, store, task_name, combination_length, rng=None):
+    """
+    Load the templates and build the renderer of the task
+    :param args:
+    :param store:
+    :param task_name:
+    :param combination_length:
+    :param rng: random stream used to render
+    :return: PuzzleRenderer
+    """
+    print("Loading templates...")
     if args.use_mturk_template:
+        train_templates, test_templates = load_task_templates(args)
         templatorClass = TemplatorAMT
     else:
         synthetic_templates_per_rel = {}
@@ -61,55 +92,115 @@ def generate_rows(args, store, task_name, split=0.8, prev_patterns=None):
         for gender, gv in val.items():
             query_templates[gv['rel']] = store.question_store['relational']
     query_templator_class = TemplatorSynthetic
+    return PuzzleRenderer(train_templates, test_templates, templatorClass,
+                          query_templates, query_templator_class,
+                          combination_length=combination_length, task_name=task_name, rng=rng)
+
+
+def equal_weight(f_comb_count):
+    """
+    Weights to keep all generated patterns homogenously distributed
+    :param f_comb_count: dict pattern -> count
+    :return: dict pattern -> weight, or None if there is nothing to balance yet
+    """
+    if len(f_comb_count) == 0:
+        return None
+    min_c = min([v for k,v in f_comb_count.items()])
+    return {k:(min_c/v) for k,v in f_comb_count.items()}
+
+
+def allowed_test_patterns(args, split, prev_patterns):
+    """
+    if unique_test_pattern flag is set, and split is 0 (which indicates the task is test),
+    only take the same test patterns as before
+    :return: set of allowed patterns, or None if all patterns are allowed
+    """
+    if args.unique_test_pattern and split == 0 and prev_patterns:
+        test_patterns = prev_patterns.get(args.relation_length, {}).get('test', [])
+        if len(test_patterns) > 0:
+            return set(test_patterns)
+    return None
+
+
+class ShardGenerator:
+    """
+    Owns an ancestry and its relation builder, and generates puzzles from it
+    one gender flip state at a time
+    """
+    def __init__(self, args, store, allowed_patterns=None, rng=None):
+        """
+
+        :param args:
+        :param store:
+        :param allowed_patterns: if given, only keep puzzles of these patterns
+        :param rng: random stream of the shard, shared by its ancestry and relation builder
+        """
+        self.args = args
+        self.allowed_patterns = allowed_patterns
+        self.rng = rng if rng is not None else random.Random()
+        self.anc = Ancestry(args, store, rng=self.rng)
+        self.rb = RelationBuilder(args, store, self.anc, rng=self.rng)
+
+    def next_batch(self, weight=None):
+        """
+        Generate the puzzles of the current flip state, then flip
+        :param weight: pattern weights, see ``RelationBuilder.prune_puzzles``
+        :return: list of puzzles, can be empty
+        """
+        rb = self.rb
+        puzzles = []
+        status = rb.build()
+        if status:
+            rb.add_facts()
+            if weight:
+                rb.generate_puzzles(weight)
+            else:
+                rb.generate_puzzles()
+            puzzles = [pz for pz in rb.puzzles.values()
+                       if self.allowed_patterns is None or pz.relation_comb in self.allowed_patterns]
+        rb.reset_puzzle()
+        rb.anc.next_flip()
+        return puzzles
+
+
+def generate_rows(args, store, task_name, split=0.8, prev_patterns=None, dedup=None):
+    combination_length = check_combination_length(args)
+    # generate
+    print(args.relation_length)
+    rng = make_rng(args.seed, task_name, split, 'shard', 0)
+    renderer = build_renderer(args, store, task_name, combination_length, rng=rng)
+    all_puzzles = {}
 
     pb = tqdm(total=args.num_rows)
     num_stories = args.num_rows
     stories_left = num_stories
-    columns = ['id', 'story', 'query', 'text_query', 'target', 'text_target', 'clean_story', 'proof_state', 'f_comb',
-               'task_name','story_edges','edge_types','query_edge','genders', 'syn_story', 'node_mapping', 'task_split']
+    columns = list(ROW_COLUMNS)
     f_comb_count = {}
-    rows = []
+    rows = ColumnarRows(columns)
     anc_num = 0
     anc_num += 1
-    anc = Ancestry(args, store)
-    rb = RelationBuilder(args, store, anc)
+    shard = ShardGenerator(args, store, allowed_test_patterns(args, split, prev_patterns), rng=rng)
+    stale = 0
     while stories_left > 0:
-        status = rb.build()
-        if not status:
-            rb.reset_puzzle()
-            rb.anc.next_flip()
-            continue
-        rb.add_facts()
         # keeping a count of generated patterns to make sure we have homogenous distribution
-        if len(f_comb_count) > 0 and args.equal:
-            min_c = min([v for k,v in f_comb_count.items()])
-            weight = {k:(min_c/v) for k,v in f_comb_count.items()}
-            rb.generate_puzzles(weight)
-        else:
-            rb.generate_puzzles()
-        # if unique_test_pattern flag is set, and split is 0 (which indicates the task is test),
-        # only take the same test patterns as before
-        # also assert that the relation - test is present
-        if args.unique_test_pattern and split == 0 and len(prev_patterns) > 0 and len(prev_patterns[args.relation_length]['test']) > 0:
-            # if all these conditions met, prune the puzzles
-            todel = []
-            for pid,puzzle in rb.puzzles.items():
-                if puzzle.relation_comb not in prev_patterns[args.relation_length]['test']:
-                    todel.append(pid)
-            for pid in todel:
-                del rb.puzzles[pid]
-        # now we have got the puzzles, assign the templators
-        for pid, puzzle in rb.puzzles.items():
+        puzzles = shard.next_batch(equal_weight(f_comb_count) if args.equal else None)
+        if dedup is not None and puzzles:
+            puzzles = [puzzle for puzzle in puzzles if not dedup.seen(dedup.fingerprint(puzzle))]
+            stale = 0 if puzzles else stale + 1
+            if stale >= DEDUP_PATIENCE:
+                print("No new unique puzzle in {} batches, stopping with {} puzzles".format(stale, len(all_puzzles)))
+                break
+        for puzzle in puzzles:
             if puzzle.relation_comb not in f_comb_count:
                 f_comb_count[puzzle.relation_comb] = 0
             f_comb_count[puzzle.relation_comb] += 1
             pb.update(1)
             stories_left -= 1
-        # store the puzzles
-        all_puzzles.update(rb.puzzles)
-        rb.reset_puzzle()
-        rb.anc.next_flip()
+            # store the puzzles
+            all_puzzles[puzzle.id] = puzzle
     pb.close()
+    if dedup is not None:
+        print("Duplicate puzzles dropped : {}".format(dedup.dropped))
     print("Puzzles created. Now splitting train and test on pattern level")
     print("Number of unique puzzles : {}".format(len(all_puzzles)))
     pattern_puzzles = {}
@@ -118,85 +209,66 @@ def generate_rows(args, store, task_name, split=0.8, prev_patterns=None):
             pattern_puzzles[pz.relation_comb] = []
         pattern_puzzles[pz.relation_comb].append(pid)
     print("Number of unique patterns : {}".format(len(pattern_puzzles)))
-    train_puzzles = []
-    test_puzzles = []
-    sp = int(len(pattern_puzzles) * split)
-    all_patterns = list(pattern_puzzles.keys())
-
     no_pattern_overlap = not args.holdout
     # if k=2, then set no_pattern_overlap=True
     if args.relation_length == 2:
         no_pattern_overlap = True
 
-    if not no_pattern_overlap:
-        # for case > 3, strict no pattern overlap
-        train_patterns = all_patterns[:sp]
-        pzs = [pattern_puzzles[p] for p in train_patterns]
-        pzs = [s for p in pzs for s in p]
-        train_puzzles.extend(pzs)
-        test_patterns = all_patterns[sp:]
-        pzs = [pattern_puzzles[p] for p in test_patterns]
-        pzs = [s for p in pzs for s in p]
-        test_puzzles.extend(pzs)
+    if args.split_by == 'hash':
+        # each puzzle is assigned on its own, independently of the generation order
+        planner = make_splitter(args, split, not no_pattern_overlap)
+        puzzle_split = {pid: planner.assign(pz.relation_comb, pid) for pid, pz in all_puzzles.items()}
+        train_puzzles = set(pid for pid, sp in puzzle_split.items() if sp == 'train')
+        test_puzzles = set(pid for pid, sp in puzzle_split.items() if sp == 'test')
+        train_patterns = planner.train_patterns
+        test_patterns = planner.test_patterns
     else:
-        # for case of 2, pattern overlap but templators are different
-        # In this case, we have overlapping patterns, first choose the overlapping patterns
-        # we directly split on puzzle level
-        train_patterns = all_patterns
-        test_patterns = all_patterns[sp:]
-        pzs_train = []
-        pzs_test = []
-        for pattern in all_patterns:
-            pz = pattern_puzzles[pattern]
-            if pattern in test_patterns:
-                # now split - hacky way
-                sz = int(len(pz) * (split - 0.2))
-                pzs_train.extend(pz[:sz])
-                pzs_test.extend(pz[sz:])
-            else:
-                pzs_train.extend(pz)
-        train_puzzles.extend(pzs_train)
-        test_puzzles.extend(pzs_test)
+        train_puzzles = set()
+        test_puzzles = set()
+        sp = int(len(pattern_puzzles) * split)
+        all_patterns = list(pattern_puzzles.keys())
+
+        if not no_pattern_overlap:
+            # for case > 3, strict no pattern overlap
+            train_patterns = all_patterns[:sp]
+            pzs = [pattern_puzzles[p] for p in train_patterns]
+            pzs = [s for p in pzs for s in p]
+            train_puzzles.update(pzs)
+            test_patterns = all_patterns[sp:]
+            pzs = [pattern_puzzles[p] for p in test_patterns]
+            pzs = [s for p in pzs for s in p]
+            test_puzzles.update(pzs)
+        else:
+            # for case of 2, pattern overlap but templators are different
+            # In this case, we have overlapping patterns, first choose the overlapping patterns
+            # we directly split on puzzle level
+            train_patterns = all_patterns
+            test_patterns = all_patterns[sp:]
+            test_pattern_set = set(test_patterns)
+            pzs_train = []
+            pzs_test = []
+            for pattern in all_patterns:
+                pz = pattern_puzzles[pattern]
+                if pattern in test_pattern_set:
+                    # now split - hacky way
+                    sz = int(len(pz) * (split - 0.2))
+                    pzs_train.extend(pz[:sz])
+                    pzs_test.extend(pz[sz:])
+                else:
+                    pzs_train.extend(pz)
+            train_puzzles.update(pzs_train)
+            test_puzzles.update(pzs_test)
 
     print("# Train puzzles : {}".format(len(train_puzzles)))
     print("# Test puzzles : {}".format(len(test_puzzles)))
     pb = tqdm(total=len(all_puzzles))
     # saving in csv
-    for pid, puzzle in all_puzzles.items():
-        task_split = ''
-        if pid in train_puzzles:
-            task_split = 'train'
-            templator = templatorClass(templates=train_templates, family=puzzle.anc.family_data)
-        elif pid in test_puzzles:
-            task_split = 'test'
-            templator = templatorClass(templates=test_templates, family=puzzle.anc.family_data)
-        else:
-            AssertionError("pid must be either in train or test")
-        story_text = puzzle.generate_text(stype='story', combination_length=combination_length, templator=templator)
-        fact_text = puzzle.generate_text(stype='fact', combination_length=combination_length, templator=templator)
-        story = story_text + fact_text
-        story = random.sample(story, len(story))
-        story = ' '.join(story)
-        clean_story = ' '.join(story_text)
-        target_text = puzzle.generate_text(stype='target', combination_length=1, templator=templator)
-
-        story_key_edges = puzzle.get_story_relations(stype='story') + puzzle.get_story_relations(stype='fact')
-        # Build query text
-        query_templator = query_templator_class(templates=query_templates, family=puzzle.anc.family_data)
-        query_text = puzzle.generate_text(stype='query', combination_length=1, templator=query_templator)
-        query_text = ' '.join(query_text)
-        query_text = query_text.replace('?.', '?')  # remove trailing '.'
-        puzzle.convert_node_ids(stype='story')
-        puzzle.convert_node_ids(stype='fact')
-        story_keys_changed_ids = puzzle.get_sorted_story_edges(stype='story') + puzzle.get_sorted_story_edges(stype='fact')
-        query_edge = puzzle.get_sorted_query_edge()
-
-        genders = puzzle.get_name_gender_string()
-
-        rows.append([pid, story, puzzle.query_text, query_text, puzzle.target_edge_rel, target_text,
-                     clean_story, puzzle.proof_trace, puzzle.relation_comb, task_name, story_keys_changed_ids,
-                     story_key_edges, query_edge, genders, '', puzzle.story_sort_dict, task_split])
-        pb.update(1)
+    puzzles = list(all_puzzles.values())
+    for i in range(0, len(puzzles), RENDER_BATCH):
+        batch = puzzles[i:i + RENDER_BATCH]
+        splits = ['train' if pz.id in train_puzzles else 'test' for pz in batch]
+        rows.extend(renderer.render_batch(batch, splits))
+        pb.update(len(batch))
     pb.close()
 
     print("{} ancestries created".format(anc_num))
@@ -204,8 +276,278 @@ def generate_rows(args, store, task_name, split=0.8, prev_patterns=None):
     return columns, rows, all_puzzles, train_patterns, test_patterns
 
 
+class LocalShard:
+    """
+    Shard running in the current process
+    ``submit`` / ``result`` mirror ShardProcess, so the coordinator in ``stream_rows``
+    does not need to know where the shard runs
+    """
+    def __init__(self, args, store, task_name, allowed_patterns=None, rng=None, state=None):
+        """
+
+        :param args:
+        :param store:
+        :param task_name:
+        :param allowed_patterns:
+        :param rng: random stream of the shard
+        :param state: if given, resume from this saved ``state()`` instead
+        """
+        if state is None:
+            self.shard = ShardGenerator(args, store, allowed_patterns, rng=rng)
+            self.pending = []
+        else:
+            self.shard, self.pending = state
+        self.dedup_mode = args.dedup
+        self.renderer = build_renderer(args, store, task_name, check_combination_length(args),
+                                       rng=self.shard.rng)
+        self._step = None
+
+    def step(self, splits, weight=None, build=True):
+        """
+        Render the pending puzzles with the given splits, then build the next batch
+        :param splits: one split per pending puzzle, None to drop the puzzle
+        :param weight: pattern weights for the next batch
+        :param build: if False, only render
+        :return: (rendered rows, [(pid, pattern, fingerprint)] of the new pending batch or None),
+            fingerprints are None without ``--dedup``
+        """
+        keep = [(pz, sp) for pz, sp in zip(self.pending, splits or []) if sp is not None]
+        rows = self.renderer.render_batch([pz for pz, sp in keep], [sp for pz, sp in keep])
+        self.pending = []
+        candidates = None
+        if build:
+            self.pending = self.shard.next_batch(weight)
+            names = self.dedup_mode == 'story'
+            candidates = [(pz.id, pz.relation_comb, puzzle_fingerprint(pz, names) if self.dedup_mode else None)
+                          for pz in self.pending]
+        return rows, candidates
+
+    def submit(self, splits, weight=None, build=True):
+        self._step = (splits, weight, build)
+
+    def result(self):
+        return self.step(*self._step)
+
+    def state(self):
+        """
+        Picklable state of the shard: the generator with its random stream, and the pending puzzles
+        :return:
+        """
+        return self.shard, self.pending
+
+    def close(self):
+        pass
+
+
+def _shard_worker(conn, parent_conn, args, store, task_name, allowed_patterns, shard_rngs, shard_states):
+    # close the inherited coordinator end, so that recv fails if the coordinator dies
+    parent_conn.close()
+    shards = {sid: LocalShard(args, store, task_name, allowed_patterns, rng=rng, state=shard_states.get(sid))
+              for sid, rng in shard_rngs.items()}
+    while True:
+        cmd, sid, payload = conn.recv()
+        if cmd == 'close':
+            break
+        if cmd == 'state':
+            conn.send(shards[sid].state())
+        else:
+            conn.send(shards[sid].step(*payload))
+    conn.close()
+
+
+class ShardProcess:
+    """
+    Worker process hosting one or more shards, each with its own ancestry and relation builder
+    Requests are answered in the order they are submitted
+    """
+    def __init__(self, args, store, task_name, allowed_patterns=None, shard_rngs=None, shard_states=None):
+        """
+
+        :param args:
+        :param store:
+        :param task_name:
+        :param allowed_patterns:
+        :param shard_rngs: dict shard id -> random stream of the shards hosted by this process
+        :param shard_states: dict shard id -> saved state to resume the shard from
+        """
+        self.conn, child_conn = mp.Pipe()
+        self.process = mp.Process(target=_shard_worker,
+                                  args=(child_conn, self.conn, args, store, task_name, allowed_patterns,
+                                        shard_rngs, shard_states or {}))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def submit(self, sid, splits, weight=None, build=True):
+        self.conn.send(('step', sid, (splits, weight, build)))
+
+    def result(self):
+        return self.conn.recv()
+
+    def state(self, sid):
+        self.conn.send(('state', sid, None))
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.send(('close', None, None))
+        self.process.join()
+
+
+class RemoteShard:
+    """
+    Shard hosted by a ShardProcess, same interface as LocalShard
+    """
+    def __init__(self, process, sid):
+        self.process = process
+        self.sid = sid
+
+    def submit(self, splits, weight=None, build=True):
+        self.process.submit(self.sid, splits, weight, build)
+
+    def result(self):
+        return self.process.result()
+
+    def state(self):
+        return self.process.state(self.sid)
+
+    def close(self):
+        pass
+
+
+def num_shards(args):
+    """
+    Number of shards of a task, ``args.shards``, fixed by default so that the output of a
+    seed does not depend on ``--workers``. 0 means one shard per worker
+    """
+    return args.shards if args.shards > 0 else max(args.workers, 1)
+
+
+def open_shards(args, store, task_name, split, allowed_patterns=None, states=None):
+    """
+    Create the shards of a task
+    The number of shards is given by ``num_shards``. Each shard has its own random stream
+    derived from ``--seed``, so for a fixed number of shards the output does not depend on
+    the number of worker processes hosting them.
+    :param states: saved shard states to resume from, one per shard
+    :return: list of shards, list of worker processes
+    """
+    shard_count = num_shards(args)
+    rngs = [make_rng(args.seed, task_name, split, 'shard', sid) for sid in range(shard_count)]
+    if states is None:
+        states = [None] * shard_count
+    if args.workers <= 1:
+        return [LocalShard(args, store, task_name, allowed_patterns, rng=rng, state=state)
+                for rng, state in zip(rngs, states)], []
+    num_workers = min(args.workers, shard_count)
+    processes = [ShardProcess(args, store, task_name, allowed_patterns,
+                              {sid: rngs[sid] for sid in range(w, shard_count, num_workers)},
+                              {sid: states[sid] for sid in range(w, shard_count, num_workers)})
+                 for w in range(num_workers)]
+    return [RemoteShard(processes[sid % num_workers], sid) for sid in range(shard_count)], processes
+
+
+def stream_rows(args, store, task_name, writer=None, split=0.8, prev_patterns=None, checkpoint=None, dedup=None):
+    """
+    Streaming and multi-process version of ``generate_rows``
+    Puzzles are generated by shards, each with its own ancestry, hosted by ``args.workers``
+    processes. Shards are always visited in the same order, so the output only depends on
+    the seed and the number of shards. The coordinator keeps the global pattern counts, so
+    that ``--equal`` balancing, the row budget and the split assignment are decided over
+    all shards. Each batch is
+    assigned to a split as soon as it is generated, rendered in its shard, and the rows
+    are handed over to the writer every ``args.stream_batch`` rows. Puzzles are released
+    after rendering, so memory does not grow with ``num_rows``.
+    :param args:
+    :param store:
+    :param task_name:
+    :param writer: DatasetWriter, if None the rows are collected and returned
+    :param split: ratio of train patterns
+    :param prev_patterns:
+    :param checkpoint: Checkpoint, if given the generation state is saved after each flush of
+        the writer once the checkpoint is due, and resumed from it if it holds a task state
+    :param dedup: Deduplicator, if given the puzzles already generated in the run are dropped
+    :return: same as ``generate_rows``, without the puzzles
+    """
+    print(args.relation_length)
+    columns = list(ROW_COLUMNS)
+    # if k=2, there is always pattern overlap
+    holdout = args.holdout and args.relation_length != 2
+    allowed_patterns = allowed_test_patterns(args, split, prev_patterns)
+    resume = checkpoint.state.get('task') if checkpoint is not None else None
+    if writer is not None:
+        # shard processes are forked below, make sure the writer thread is idle
+        writer.flush()
+    if resume is None:
+        splitter = make_splitter(args, split, holdout)
+        stories_left = args.num_rows
+        f_comb_count = {}
+        shards, processes = open_shards(args, store, task_name, split, allowed_patterns)
+        splits = [None] * len(shards)
+        stale = 0
+    else:
+        splitter = resume['splitter']
+        stories_left = resume['stories_left']
+        f_comb_count = resume['f_comb_count']
+        shards, processes = open_shards(args, store, task_name, split, allowed_patterns, states=resume['shards'])
+        splits = resume['splits']
+        stale = resume['stale']
+        if dedup is not None:
+            dedup.restore(resume['dedup'])
+
+    pb = tqdm(total=args.num_rows, initial=args.num_rows - stories_left)
+    rows = ColumnarRows(columns)
+    all_rows = ColumnarRows(columns)
+    build = True
+    while build:
+        build = stories_left > 0
+        weight = equal_weight(f_comb_count) if args.equal else None
+        for shard, shard_splits in zip(shards, splits):
+            shard.submit(shard_splits, weight, build)
+        for i, shard in enumerate(shards):
+            shard_rows, candidates = shard.result()
+            rows.extend(shard_rows)
+            if candidates is None:
+                continue
+            if stories_left <= 0:
+                # the budget is already filled by the other shards, drop the batch
+                splits[i] = None
+                continue
+            keep = [dedup is None or not dedup.seen(fingerprint) for _, _, fingerprint in candidates]
+            for (pid, pattern, _), kept in zip(candidates, keep):
+                if kept:
+                    f_comb_count[pattern] = f_comb_count.get(pattern, 0) + 1
+            splits[i] = [splitter.assign(pattern, pid) if kept else None
+                         for (pid, pattern, _), kept in zip(candidates, keep)]
+            stories_left -= sum(keep)
+            pb.update(sum(keep))
+            if candidates:
+                stale = 0 if any(keep) else stale + 1
+            if stale >= DEDUP_PATIENCE and stories_left > 0:
+                print("No new unique puzzle in {} batches, stopping with {} puzzles left".format(stale, stories_left))
+                stories_left = 0
+        if len(rows) >= args.stream_batch or not build:
+            if writer is not None:
+                writer.write(rows)
+            else:
+                all_rows.merge(rows)
+            rows = ColumnarRows(columns)
+            if build and writer is not None and checkpoint is not None and checkpoint.due():
+                checkpoint.update(writer=writer.state(), task={
+                    'splitter': splitter, 'stories_left': stories_left, 'f_comb_count': f_comb_count,
+                    'stale': stale, 'dedup': dedup.state() if dedup is not None else None,
+                    'splits': splits, 'shards': [shard.state() for shard in shards]})
+                checkpoint.save()
+    for process in processes:
+        process.close()
+    pb.close()
+    if dedup is not None:
+        print("Duplicate puzzles dropped : {}".format(dedup.dropped))
+    print("Number of unique patterns : {}".format(len(f_comb_count)))
+    return columns, all_rows, {}, splitter.train_patterns, splitter.test_patterns
+
+
 def test_run(args):
-    store = Store(args)
+    store = get_store(args)
     anc = Ancestry(args, store)
     rb = RelationBuilder(args, store, anc)
     rb.num_rel = 3
@@ -228,7 +570,9 @@ def test_run(args):
     print(rb.puzzles[pid])
 
 def main(args):
-    store = Store(args)
+    import numpy as np
+    import pandas as pd
+    store = get_store(args)
     header, rows = generate_rows(args, store)
     df = pd.DataFrame(columns=header, data=rows)
     # split test train
@@ -9,34 +9,31 @@
 
 # main file which defines the tasks
 from clutrr.args import get_args
-from clutrr.generator import generate_rows
-from clutrr.store.store import Store
-import pandas as pd
-import glob
+from clutrr.generator import generate_rows, stream_rows, load_task_templates, num_shards
+from clutrr.relations.renderer import COLUMNS
+from clutrr.store.store import get_store
+from clutrr.utils.columnar import ColumnarRows
+from clutrr.utils.writer import DatasetWriter
+from clutrr.utils.formats import file_extension, dataset_files, iter_frames, write_frame
+from clutrr.utils.sampling import GroupSampler
+from clutrr.utils.stats import STATS_FILE, analyze_directory, load_stats
+from clutrr.utils.checkpoint import Checkpoint
+from clutrr.utils.registry import PatternRegistry
+from clutrr.utils.dedup import CAPACITY_MARGIN, Deduplicator
+from clutrr.utils.puzzle_archive import PUZZLE_ARCHIVE, write_puzzles
+from clutrr.utils.reader import build_row_index
+from clutrr.utils.fingerprint import CONFIG_FILE, dataset_fingerprint, dataset_folder_name, file_checksums, \
+    find_dataset
+from clutrr.utils.placeholders import resolve_placeholders, TEMPLATE_MEMBER
 import copy
 import uuid
 import os
 import json
-import shutil
 import sys
-import nltk
-from nltk.tokenize import word_tokenize
-import pickle as pkl
-import requests
-import hashlib
-import zipfile
-
-# check if nltk.punkt is installed
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+import multiprocessing as mp
 
 logPath = '../logs/'
 fileName = 'data'
-# sha of the placeholder files
-SHA_SUM = 'ed2264836bb17fe094dc21fe6bb7492b000df520eb86f8e60b8441121f8ff924'
-download_url = "https://cs.mcgill.ca/~ksinha4/data/"
 
 import logging
 logging.basicConfig(
@@ -50,6 +47,28 @@ logging.basicConfig(
 
 logger = logging.getLogger()
 
+
+# Clutrr instance and store inherited by the task worker processes
+_TASK_WORKER = None
+
+
+def _init_task_worker(clutrr, store):
+    global _TASK_WORKER
+    _TASK_WORKER = (clutrr, store)
+
+
+def _generate_choice(job):
+    """
+    Generate one task choice in a task worker
+    :param job: (choice, num_rows, split, unique patterns seen by the choice)
+    :return: generated data, unique patterns of the choice
+    """
+    clutrr, store = _TASK_WORKER
+    choice, num_rows, split, prev_patterns = job
+    clutrr.unique_patterns = prev_patterns
+    data = clutrr.generate(choice, clutrr.args, num_rows=num_rows, data_type='train', split=split, store=store)
+    return data, clutrr.unique_patterns[int(choice.split('.')[1])]
+
 class Clutrr:
     """
     Data Generation Script for the paper
@@ -59,9 +78,15 @@ class Clutrr:
         self.args = self._init_vars(args)
         # store the unique patterns for each relation here
         self.unique_patterns = {}
+        self.registry = PatternRegistry(self.args.pattern_registry) if self.args.pattern_registry else None
+        # fingerprints of the puzzles of the run, with --dedup
+        self.dedup = None
+        # fingerprint of the dataset of the run, see utils/fingerprint.py
+        self.fingerprint = None
         self.setup()
 
-    def generate(self, choice, args, num_rows=0, data_type='train', multi=False, split=None):
+    def generate(self, choice, args, num_rows=0, data_type='train', multi=False, split=None, writer=None,
+                 checkpoint=None, store=None):
         """
         Choose the task and the relation length
         Return the used args for storing
@@ -70,6 +95,9 @@ class Clutrr:
         :param num_rows:
         :param data_type:
         :param multi:
+        :param writer: if given, stream the rows into this DatasetWriter
+        :param checkpoint: Checkpoint of the run, if any
+        :param store: pre-loaded Store, shared by all the choices of the run
         :return:
         """
         args = copy.deepcopy(args)
@@ -82,17 +110,33 @@ class Clutrr:
             task_method = getattr(self, task_name, lambda: "Task {} not implemented".format(choice))
             args = task_method(args)
             args.relation_length = int(relation_length)
-            store = Store(args)
-            columns, rows, all_puzzles, train_patterns, test_patterns = generate_rows(args,
-                        store, task_name  + '.{}'.format(relation_length), split=split, prev_patterns=self.unique_patterns)
+            if store is None:
+                store = get_store(args)
+            registry_name = args.registry_name or args.data_name
+            if (self.registry is not None and args.unique_test_pattern and split == 0
+                    and args.relation_length not in self.unique_patterns):
+                # no train task of this length in the run, use the patterns of the previous runs
+                self.unique_patterns[args.relation_length] = self.registry.unique_patterns(
+                    registry_name, args.relation_length)
+            if writer is not None or args.workers > 1:
+                columns, rows, all_puzzles, train_patterns, test_patterns = stream_rows(args,
+                        store, task_name  + '.{}'.format(relation_length), writer=writer, split=split,
+                        prev_patterns=self.unique_patterns, checkpoint=checkpoint, dedup=self.dedup)
+            else:
+                columns, rows, all_puzzles, train_patterns, test_patterns = generate_rows(args,
+                        store, task_name  + '.{}'.format(relation_length), split=split, prev_patterns=self.unique_patterns,
+                        dedup=self.dedup)
             self.unique_patterns[int(relation_length)] = {
                 'train': train_patterns,
                 'test': test_patterns
             }
+            if self.registry is not None:
+                # a test task has no train patterns of its own
+                self.registry.record(registry_name, relation_length, train_patterns if split else (), test_patterns)
             return (columns, rows, all_puzzles), args
 
         else:
-            rows = []
+            rows = None
             columns = []
             puzzles = {}
             for ch in choice:
@@ -102,17 +146,31 @@ class Clutrr:
                 task_method = getattr(self, task_name, lambda: "Task {} not implemented".format(choice))
                 args = task_method(args)
                 args.relation_length = int(relation_length)
-                store = Store(args)
-                columns,r,pz = generate_rows(args, store, task_name + '.{}'.format(relation_length))
-                rows.extend(r)
+                store = get_store(args)
+                columns, r, pz, _, _ = generate_rows(args, store, task_name + '.{}'.format(relation_length),
+                                                     split=split, prev_patterns=self.unique_patterns)
+                if rows is None:
+                    rows = r
+                else:
+                    rows.merge(r)
                 puzzles.update(pz)
             return ((columns, rows, puzzles), args)
 
-    def run_task(self):
+    def run_task(self, store=None):
         """
         Default dispatcher method
+        :param store: pre-loaded Store, eg shared by the jobs of a sweep
+        :return: path of the created dataset folder
         """
         args = self.args
+        self.fingerprint = dataset_fingerprint(args)
+        if args.reuse and args.seed is None:
+            logger.warning("--reuse needs a --seed to reproduce the dataset, generating it")
+        elif args.reuse:
+            directory = find_dataset(self.output_path(args), self.fingerprint)
+            if directory is not None:
+                logger.info("Reusing dataset {} with fingerprint {}".format(directory, self.fingerprint))
+                return directory
         train_rows = args.train_rows
         test_rows = args.test_rows
         train_choices = args.train_tasks.split(',')
@@ -124,8 +182,45 @@ class Clutrr:
         for t in test_choices:
             if t not in all_choices:
                 all_choices.append(t)
+        if args.dedup:
+            # the filter is sized for all the rows of the run, and the puzzles generated past them
+            capacity = CAPACITY_MARGIN * sum(train_rows + test_rows if choice in train_choices else test_rows
+                                             for choice in all_choices)
+            self.dedup = Deduplicator(capacity, error_rate=args.dedup_error_rate, mode=args.dedup)
+        checkpoint = None
+        resumed = None
+        if args.checkpoint and args.output_format == 'parquet':
+            logger.warning("--checkpoint is not supported with --output_format parquet, running without checkpoints")
+            args.checkpoint = False
+        if args.checkpoint:
+            if not args.stream:
+                logger.info("--checkpoint writes the rows while they are generated, enabling --stream")
+                args.stream = True
+            checkpoint = Checkpoint.for_args(args, self.output_path(args))
+            resumed = checkpoint.load()
+        if args.stream or args.workers > 1:
+            if args.shards <= 0 and args.workers > 1:
+                logger.warning("--shards 0 : one shard per worker, the dataset of a --seed depends on --workers")
+            elif args.workers > num_shards(args):
+                logger.warning("only {} of the {} workers are used, one per shard, see --shards".format(
+                    num_shards(args), args.workers))
+        writer = None
+        if args.stream:
+            # rows are written to the dataset folder while they are generated
+            writer = self.open_writer(args, directory=resumed['directory'] if resumed else None)
         train_datas = []
-        for choice in all_choices:
+        if resumed is not None:
+            writer.restore(resumed['writer'])
+            train_datas = resumed['done']
+            self.unique_patterns = resumed['unique_patterns']
+            if self.dedup is not None:
+                self.dedup.restore(resumed['dedup'])
+            logger.info("Resuming from checkpoint {} : {} tasks done".format(checkpoint.path, len(train_datas)))
+        elif checkpoint is not None:
+            checkpoint.update(directory=writer.directory, writer=writer.state(), done=train_datas,
+                              unique_patterns=self.unique_patterns, dedup=self.dedup_state(), task=None)
+        jobs = []
+        for choice in all_choices[len(train_datas):]:
             if choice in train_choices:
                 # split
                 choice_split = train_rows / (train_rows + test_rows)
@@ -134,10 +229,83 @@ class Clutrr:
                 # test, no split
                 choice_split = 0.0
                 num_rows = test_rows
-            print("Split : {}".format(choice_split))
-            train_datas.append(self.generate(choice, args, num_rows=num_rows, data_type='train', split=choice_split))
-
-        self.store(train_datas, None, args)
+            jobs.append((choice, num_rows, choice_split))
+        # the store does not depend on the task, load it once for all choices
+        if store is None:
+            store = get_store(args)
+        if args.task_workers > 1 and writer is None and args.workers <= 1 and self.dedup is None:
+            train_datas.extend(self.generate_parallel(jobs, args, store))
+        else:
+            if args.task_workers > 1:
+                logger.warning("--task_workers is not supported with --stream, --checkpoint, --workers or --dedup, "
+                               "generating the tasks one by one")
+            for choice, num_rows, choice_split in jobs:
+                print("Split : {}".format(choice_split))
+                train_datas.append(self.generate(choice, args, num_rows=num_rows, data_type='train',
+                                                 split=choice_split, writer=writer, checkpoint=checkpoint,
+                                                 store=store))
+                if checkpoint is not None:
+                    checkpoint.update(writer=writer.state(), done=train_datas, unique_patterns=self.unique_patterns,
+                                      dedup=self.dedup_state(), task=None)
+                    checkpoint.save()
+
+        directory = self.store(train_datas, None, args, writer=writer)
+        if checkpoint is not None:
+            checkpoint.remove()
+        return directory
+
+    def dedup_state(self):
+        return self.dedup.state() if self.dedup is not None else None
+
+    def generate_parallel(self, jobs, args, store):
+        """
+        Generate the task choices in a pool of ``args.task_workers`` forked processes
+        The store and the templates are loaded before forking and inherited by the workers.
+        With ``--unique_test_pattern``, a test choice only keeps the test patterns of the
+        previous choice of the same relation length, so it runs in a later wave than that choice.
+        :param jobs: list of (choice, num_rows, split), in the order of the serial run
+        :param args:
+        :param store: pre-loaded Store
+        :return: list of generated data, in the order of jobs
+        """
+        if args.use_mturk_template:
+            load_task_templates(args)
+        # wave and dependency of each job
+        waves = []
+        deps = []
+        last_job = {}  # relation length -> index of the last job of this length
+        for i, (choice, num_rows, split) in enumerate(jobs):
+            relation_length = int(choice.split('.')[1])
+            dep = last_job.get(relation_length)
+            if args.unique_test_pattern and split == 0 and dep is not None:
+                deps.append(dep)
+                waves.append(waves[dep] + 1)
+            else:
+                deps.append(None)
+                waves.append(0)
+            last_job[relation_length] = i
+
+        results = [None] * len(jobs)
+        patterns = [None] * len(jobs)
+        num_procs = min(args.task_workers, len(jobs))
+        with mp.get_context('fork').Pool(num_procs, initializer=_init_task_worker,
+                                         initargs=(self, store)) as pool:
+            for wave in range(max(waves) + 1 if jobs else 0):
+                idx = [i for i, w in enumerate(waves) if w == wave]
+                wave_jobs = []
+                for i in idx:
+                    choice, num_rows, split = jobs[i]
+                    prev_patterns = {}
+                    if deps[i] is not None:
+                        prev_patterns[int(jobs[deps[i]][0].split('.')[1])] = patterns[deps[i]]
+                    wave_jobs.append((choice, num_rows, split, prev_patterns))
+                logger.info("Generating {} tasks in parallel : {}".format(len(idx), [jobs[i][0] for i in idx]))
+                for i, (data, choice_patterns) in zip(idx, pool.map(_generate_choice, wave_jobs)):
+                    results[i] = data
+                    patterns[i] = choice_patterns
+        for (choice, num_rows, split), choice_patterns in zip(jobs, patterns):
+            self.unique_patterns[int(choice.split('.')[1])] = choice_patterns
+        return results
 
     def assign_name(self, args, task_name):
         """
@@ -148,37 +316,89 @@ class Clutrr:
         :param args:
         :return:
         """
-        name = '{}_{}.csv'.format(task_name, args.data_type)
+        name = '{}_{}{}'.format(task_name, args.data_type, file_extension(args.output_format, args.compression))
         return name
 
-    def store(self, train_data, test_data, args):
+    def output_path(self, args):
+        """
+        Output dir of the datasets, created if needed
+        :param args:
+        :return:
+        """
+        path = os.path.join(os.path.abspath(os.pardir), args.output_dir)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def make_directory(self, args):
+        """
+        Create a new dataset folder in the output dir
+        :param args:
+        :return: path of the folder
+        """
+        base_path = self.output_path(args)
+        if args.seed is not None and self.fingerprint is not None:
+            # seeded runs are reproducible, their folder is named after the fingerprint
+            directory = os.path.join(base_path, dataset_folder_name(self.fingerprint))
+            try:
+                os.makedirs(directory)
+                return directory
+            except FileExistsError:
+                # eg an identical run in the same output dir, fall back to a random name
+                pass
+        # derive folder name as a random selection of characters
+        directory = ''
+        while True:
+            folder_name = 'data_{}'.format(str(uuid.uuid4())[:8])
+            directory = os.path.join(base_path, folder_name)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+                break
+        return directory
+
+    def open_writer(self, args, directory=None):
+        """
+        Create the dataset folder and the writer for its train and test files
+        :param args:
+        :param directory: existing dataset folder to write into, eg when resuming
+        :return: DatasetWriter
+        """
+        name_args = copy.copy(args)
+        name_args.data_type = 'train'
+        train_fl_name = self.assign_name(name_args, args.train_tasks)
+        name_args.data_type = 'test'
+        test_files = {'task_' + test_task: self.assign_name(name_args, test_task)
+                      for test_task in args.test_tasks.split(',')}
+        if directory is None:
+            directory = self.make_directory(args)
+        return DatasetWriter(directory, COLUMNS, train_fl_name, test_files, queue_size=args.write_queue,
+                             output_format=args.output_format, compression=args.compression,
+                             row_group_size=args.row_group_size,
+                             relations=get_store(args).relation_vocab if args.tensor_export else None)
+
+    def store(self, train_data, test_data, args, writer=None):
         """
         Take the dataset and do the following:
         - Create a name for the files
         - Create a folder and put the files in
         - Write the config in a file and put it in the folder
-        - Compute the hash of the train and test files and store it in a file
+        - Compute the hash of the files of the dataset and store it in the config
         :param train_data list of rows
         :param test_data list of list of rows
-        :return:
+        :param writer: DatasetWriter the rows were streamed into, if any
+        :return: path of the dataset folder
         """
         train_tasks = args.train_tasks.split(',')
         all_puzzles = {}
-        train_df = []
-        test_df = []
+        rows = None
         for i, td in enumerate(train_data):
             train_rows_puzzles, train_args = td
             assert len(train_rows_puzzles) == 3
-            train_rows, train_puzzles = train_rows_puzzles[:-1], train_rows_puzzles[-1]
-            trdfs = [r for r in train_rows[1] if r[-1] == 'train']
-            tsdfs = [r for r in train_rows[1] if r[-1] == 'test']
-            train_df.append(pd.DataFrame(columns=train_rows[0], data=trdfs))
-            test_df.append(pd.DataFrame(columns=train_rows[0], data=tsdfs))
-
-        train_df = pd.concat(train_df)
-        test_df = pd.concat(test_df)
-        logger.info("Training rows : {}".format(len(train_df)))
-        logger.info("Testing rows : {}".format(len(test_df)))
+            columns, task_rows, train_puzzles = train_rows_puzzles
+            # rows are already partitioned by split and task, just collect the partitions
+            if rows is None:
+                rows = ColumnarRows(columns)
+            rows.merge(task_rows)
+            all_puzzles.update(train_puzzles)
 
         # prepare configs
         all_config = {}
@@ -189,78 +409,94 @@ class Clutrr:
         all_config['args'] = {}
         all_config['args'][train_fl_name] = vars(train_args)
         test_tasks = args.test_tasks.split(',')
-        test_dfs = []
         for test_task in test_tasks:
             train_args.data_type = 'test'
             test_fl_name = self.assign_name(train_args,test_task)
             all_config['args'][test_fl_name] = vars(train_args)
             test_fl_names.append(test_fl_name)
-            test_dfs.append(test_df[test_df.task_name == 'task_'+test_task])
 
-        base_path = os.path.abspath(os.pardir)
-        # derive folder name as a random selection of characters
-        directory = ''
-        while True:
-            folder_name = 'data_{}'.format(str(uuid.uuid4())[:8])
-            directory = os.path.join(base_path, args.output_dir, folder_name)
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-                break
-        train_df.to_csv(os.path.join(directory, train_fl_name))
-        for i,test_fl_name in enumerate(test_fl_names):
-            test_df = test_dfs[i]
-            test_df.to_csv(os.path.join(directory, test_fl_name))
+        if writer is None:
+            writer = self.open_writer(args)
+        writer.write(rows)
+        writer.close()
+        directory = writer.directory
+        logger.info("Training rows : {}".format(writer.count('train')))
+        logger.info("Testing rows : {}".format(writer.count('test')))
+        all_config['fingerprint'] = self.fingerprint
+        if args.store_full_puzzles and (args.stream or args.workers > 1):
+            logger.warning("--store_full_puzzles is not supported with --stream or --workers, {} not written".format(
+                PUZZLE_ARCHIVE))
+        elif args.store_full_puzzles:
+            # dump all puzzles, each ancestry state is stored once
+            num_states = write_puzzles(os.path.join(directory, PUZZLE_ARCHIVE), all_puzzles.values(),
+                                       get_store(args).relations_store)
+            logger.info("Stored {} puzzles of {} ancestry states".format(len(all_puzzles), num_states))
+        if args.row_index:
+            if args.compression or args.output_format == 'parquet':
+                logger.warning("--row_index needs uncompressed csv or jsonl files, index not written")
+            else:
+                for fl in dataset_files(directory):
+                    build_row_index(fl)
         # dump config
-        json.dump(all_config, open(os.path.join(directory, 'config.json'),'w'))
-        if args.store_full_puzzles:
-            # dump all puzzles
-            pkl.dump(all_puzzles, open(os.path.join(directory, 'puzzles.pkl'),'wb'), protocol=-1)
-        shutil.make_archive(directory, 'zip', directory)
+        self.write_config(directory, all_config)
+        writer.write_archive()
 
         logger.info("Created dataset in {}".format(directory))
         self.analyze_data(directory)
         if args.mturk:
             self.keep_unique(directory)
+            # the files were sampled in place
+            self.write_config(directory, all_config)
+        return directory
+
+    def write_config(self, directory, config):
+        """
+        Save the config of a dataset, with the checksums of its files
+        :param directory:
+        :param config:
+        :return:
+        """
+        config['checksums'] = file_checksums(directory)
+        with open(os.path.join(directory, CONFIG_FILE), 'w') as fp:
+            json.dump(config, fp)
 
 
     def analyze_data(self, directory):
         """
-        Analyze a given directory
+        Print the statistics of a given directory
+        They are collected while writing, datasets without a stats.json sidecar are re-analyzed
         :param directory:
         :return:
         """
-        all_files = glob.glob(os.path.join(directory,'*.csv'))
-        for fl in all_files:
-            logger.info("Analyzing file {}".format(fl))
-            df = pd.read_csv(fl)
-            df['word_len'] = df.story.apply(lambda x: len(word_tokenize(x)))
-            df['word_len_clean'] = df.clean_story.apply(lambda x: len(word_tokenize(x)))
-            print("Max words : ", df.word_len.max())
-            print("Min words : ", df.word_len.min())
+        if not os.path.exists(os.path.join(directory, STATS_FILE)):
+            analyze_directory(directory, workers=max(self.args.workers, self.args.task_workers))
+        for fl_name, fl_stats in load_stats(directory).items():
+            logger.info("Analyzing file {}".format(os.path.join(directory, fl_name)))
+            print("Max words : ", fl_stats['story_tokens']['max'])
+            print("Min words : ", fl_stats['story_tokens']['min'])
             print("For clean story : ")
-            print("Max words : ", df.word_len_clean.max())
-            print("Min words : ", df.word_len_clean.min())
+            print("Max words : ", fl_stats['clean_story_tokens']['max'])
+            print("Min words : ", fl_stats['clean_story_tokens']['min'])
         logger.info("Analysis complete")
 
-    def keep_unique(self, directory, num=1):
+    def keep_unique(self, directory, num=None):
         """
         Keep num unique rows for each pattern. Handy for Mturk collection.
-        :param num:
+        Rows are grouped by ``args.unique_by`` and sampled in a single chunked pass over each file
+        :param num: rows per group, default ``args.unique_num``
         :return:
         """
-        all_files = glob.glob(os.path.join(directory, '*.csv'))
-        for fl in all_files:
-            df = pd.read_csv(fl)
-            uniq_patterns = df['f_comb'].unique()
-            udf = []
-            for up in uniq_patterns:
-                # randomly select one row for this unique pattern
-                rd = df[df['f_comb'] == up].sample(num)
-                udf.append(rd)
-            udf = pd.concat(udf)
-            udf.to_csv(fl)
-
-
+        num = num or self.args.unique_num
+        keys = self.args.unique_by.split(',')
+        for fl in dataset_files(directory):
+            sampler = GroupSampler(keys, num=num, seed=self.args.seed)
+            for df in iter_frames(fl):
+                sampler.update(df)
+            udf = sampler.result()
+            if udf is not None:
+                write_frame(udf, fl)
+        # update the sidecar to the kept rows
+        analyze_directory(directory, workers=max(self.args.workers, self.args.task_workers))
 
     def _init_vars(self, args):
         args.noise_support = False
@@ -341,39 +577,16 @@ class Clutrr:
 
     def setup(self):
         """
-        Download placeholders and update args
+        Locate the placeholders, downloading them only if they are not cached, and update args
         :return:
         """
-        placeholder_zip = "cleaned_placeholders.zip"
-        placeholder_url = download_url + placeholder_zip
         base_path = os.path.abspath(os.pardir)
-        placeholder_loc = os.path.join(base_path, placeholder_zip)
-        if os.path.exists(placeholder_loc):
-            print("downloaded placeholder data exists")
-        else:
-            print("Downloading placeholder data")
-            r = requests.get(placeholder_url)
-            with open(placeholder_loc, 'wb') as f:
-                f.write(r.content)
-            # check shasum
-            sha1 = hashlib.sha256()
-            BUF_SIZE = 65536
-            with open(placeholder_loc, 'rb') as f:
-                while True:
-                    data = f.read(BUF_SIZE)
-                    if not data:
-                        break
-                    sha1.update(data)
-            print("sha256 : {}".format(sha1.hexdigest()))
-            print("checking ...")
-            if sha1.hexdigest() != SHA_SUM:
-                raise AssertionError("downloaded corrupt data, sha256 doesn't match")
-            print("Data valid")
-            # extract zip
-            with zipfile.ZipFile(placeholder_loc, "r") as zip_ref:
-                zip_ref.extractall(os.path.join(base_path, 'clutrr'))
-        # set args
-        self.args.template_file = "cleaned_placeholders/amt_placeholders_clean"
+        if not self.args.use_mturk_template:
+            # placeholders are only read by the mturk templator
+            self.args.template_file = TEMPLATE_MEMBER
+            return
+        self.args.template_file = resolve_placeholders(base_path, placeholder_path=self.args.placeholder_path)
+        logger.info("Using placeholders {}".format(self.args.template_file))
 
 
 if __name__ == '__main__':
@@ -13,7 +13,7 @@ import random
 import itertools as it
 import copy
 from clutrr.store.store import Store
-import uuid
+from clutrr.utils.seeding import random_id
 from clutrr.relations.puzzle import Puzzle
 
 
@@ -37,9 +37,10 @@ class RelationBuilder:
         - When applying the rules, make sure to confirm to these types
     """
 
-    def __init__(self,args, store:Store, anc):
+    def __init__(self,args, store:Store, anc, rng=None):
         self.anc = anc
         self.args = args
+        self.rng = rng if rng is not None else random.Random() # random stream of this builder
         self.rules = store.rules_store
         self.store = store
         self.comp_rules = self.rules['compositional']
@@ -57,6 +58,7 @@ class RelationBuilder:
         self.puzzles = {}
         self.puzzle_ct = 0
         self.expansions = {} # (a,b) : [list]
+        self.expansion_pos = {} # (a,b) : index of the next expansion to use
         # save the edges which are used already
         self.done_edges = set()
         self.apply_almost_complete()
@@ -206,8 +208,12 @@ class RelationBuilder:
         """
         available_edges = set([k for k, v in self.anc.family.items()]) - self.done_edges
         #print("Available edges to derive backwards - {}".format(len(available_edges)))
+        # all puzzles of the current flip state share one snapshot of the ancestry
+        # and one precomputed edge -> relation table
+        anc_state = copy.deepcopy(self.anc)
+        edge_rels = self.edge_relation_table(anc_state)
         for edge in available_edges:
-            pz = self.build_one_puzzle(edge)
+            pz = self.build_one_puzzle(edge, anc_state=anc_state, edge_rels=edge_rels)
             if pz:
                 self.puzzles[pz.id] = pz
                 self.puzzle_ct += 1
@@ -217,18 +223,24 @@ class RelationBuilder:
         #print("Generated {}".format(len(self.puzzles)))
         return True
 
-    def build_one_puzzle(self, edge):
+    def build_one_puzzle(self, edge, anc_state=None, edge_rels=None):
         """
         Build one puzzle
         Return False if unable to make the puzzle
+        :param edge: target edge
+        :param anc_state: snapshot of the ancestry to attach, if None a copy is made
+        :param edge_rels: edge relation table of ``anc_state``, see ``edge_relation_table``
         :return: type Puzzle
         """
         story, proof_trace = self.derive([edge], k=self.num_rel - 1)
         if len(story) == self.num_rel:
-            id = str(uuid.uuid4())
+            id = random_id(self.rng)
+            if anc_state is None:
+                anc_state = copy.deepcopy(self.anc)
+                edge_rels = self.edge_relation_table(anc_state)
             pz = Puzzle(id=id, target_edge=edge, story=story,
-                        proof=proof_trace, ancestry=copy.deepcopy(self.anc),
-                        relations_obj=copy.deepcopy(self.relations_obj))
+                        proof=proof_trace, ancestry=anc_state,
+                        relations_obj=self.relations_obj, edge_rels=edge_rels)
             pz.derive_vals()
             return pz
         else:
@@ -270,7 +282,7 @@ class RelationBuilder:
         pztype_min_count = min([len(v) for k,v in pztype.items()])
         keep_puzzles = []
         for f_comb, pids in pztype.items():
-            keep_puzzles.extend(random.sample(pids, pztype_min_count))
+            keep_puzzles.extend(self.rng.sample(pids, pztype_min_count))
         not_keep = set(self.puzzles.keys()) - set(keep_puzzles)
         for pid in not_keep:
             del self.puzzles[pid]
@@ -317,8 +329,8 @@ class RelationBuilder:
                 return False
             else:
                 # choose a sample of 1 to k-1 edge pairs
-                num_edges = random.choice(range(1, (len(story) // 2) + 1))
-                extra_story = random.sample(extra_story, min(num_edges, len(extra_story)))
+                num_edges = self.rng.choice(range(1, (len(story) // 2) + 1))
+                extra_story = self.rng.sample(extra_story, min(num_edges, len(extra_story)))
                 # untuple the extra stories
                 extra_story = [k for e in extra_story for k in e]
                 self._test_supporting(story, extra_story)
@@ -329,7 +341,7 @@ class RelationBuilder:
             # Must have only one common node with the story
             story = puzzle.story
             num_edges = len(story)
-            sampled_edge = random.choice(story)
+            sampled_edge = self.rng.choice(story)
             extra_story = []
             for i in range(num_edges):
                 tmp = sampled_edge
@@ -344,13 +356,13 @@ class RelationBuilder:
                                 sampled_edge = e
                                 break
                     if tmp == sampled_edge:
-                        sampled_edge = random.choice(story)
+                        sampled_edge = self.rng.choice(story)
             if len(extra_story) == 0:
                 return False
             else:
                 # add a length restriction so as to not create super long text
                 # length restriction should be k+1 than the current k
-                extra_story = random.sample(extra_story, min(len(extra_story), len(story) // 2))
+                extra_story = self.rng.sample(extra_story, min(len(extra_story), len(story) // 2))
                 self._test_irrelevant(story, extra_story)
                 puzzle.add_fact(fact_type='irrelevant', fact=extra_story)
         if self.args.noise_disconnected:
@@ -360,8 +372,8 @@ class RelationBuilder:
             nodes_not_in_story = set(self.anc.family_data.keys()) - nodes_story
             possible_edges = [(x, y) for x, y in it.combinations(list(nodes_not_in_story), 2) if
                               (x, y) in self.anc.family]
-            num_edges = random.choice(range(1, (len(story) // 2) + 1))
-            possible_edges = random.sample(possible_edges, min(num_edges, len(possible_edges)))
+            num_edges = self.rng.choice(range(1, (len(story) // 2) + 1))
+            possible_edges = self.rng.sample(possible_edges, min(num_edges, len(possible_edges)))
             if len(possible_edges) == 0:
                 return False
             self._test_disconnected(story, possible_edges)
@@ -415,14 +427,16 @@ class RelationBuilder:
                         if edge not in self.expansions:
                             self.expansions[edge] = []
                         self.expansions[edge].append(new_edge_pair)
-            self.expansions[edge] = it.cycle(self.expansions[edge])
 
     def expand_new(self, edge, tp='family'):
         relation = self.anc.family[edge][tp]
         if relation not in self.comp_rules_inv[tp]:
             return None
         if edge in self.expansions:
-            return self.expansions[edge].__next__()
+            # cycle through the expansions, kept as a list and a position so that the builder can be pickled
+            pos = self.expansion_pos.get(edge, 0)
+            self.expansion_pos[edge] = (pos + 1) % len(self.expansions[edge])
+            return self.expansions[edge][pos]
         else:
             return None
 
@@ -441,7 +455,7 @@ class RelationBuilder:
             return None
         rules = list(self.comp_rules_inv[tp][relation])
         while len(rules) > 0:
-            rule = random.choice(rules)
+            rule = self.rng.choice(rules)
             rules.remove(rule)
             for node in self.anc.family_data.keys():
                 e1 = (edge[0], node)
@@ -465,7 +479,7 @@ class RelationBuilder:
                 break
             if len(list(set(edge_list) - seen)) == 0:
                 break
-            e = random.choice(list(set(edge_list) - seen))
+            e = self.rng.choice(list(set(edge_list) - seen))
             seen.add(e)
             ex_e = self.expand_new(e)
             if ex_e and (ex_e[0] not in seen and ex_e[1] not in seen and ex_e[0][::-1] not in seen and ex_e[1][::-1] not in seen):
@@ -481,6 +495,22 @@ class RelationBuilder:
                 k = k-1
         return edge_list, proof_trace
 
+    def edge_relation_table(self, anc, rel_type='family'):
+        """
+        Precompute the gendered relation of every edge for the given ancestry state
+        The table is only valid until the next gender flip of ``anc``
+        :param anc: Ancestry
+        :param rel_type:
+        :return: dict (x,y) -> relation entry, {'rel': .., 'p': [..]}
+        """
+        table = {}
+        for edge, rel in anc.family.items():
+            relation = rel.get(rel_type)
+            if relation in self.relations_obj:
+                gender = anc.family_data[edge[1]].gender
+                table[edge] = self.relations_obj[relation][gender]
+        return table
+
     def _get_edge_rel(self, edge, rel_type='family'):
         # get node attributes
         node_b_attr = self.anc.family_data[edge[1]]
@@ -528,7 +558,7 @@ class RelationBuilder:
         node_b_attr = self.anc.family_data[edge[1]]
         relation = self._get_edge_rel(edge, rel_type)
         placeholders = relation['p']
-        placeholder = random.choice(placeholders)
+        placeholder = self.rng.choice(placeholders)
         node_a_name = node_a_attr.name
         node_b_name = node_b_attr.name
         assert node_a_name != node_b_name
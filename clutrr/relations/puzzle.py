@@ -10,12 +10,9 @@
 # Main Puzzle class which maintains the state of a single puzzle
 import uuid
 import random
-from clutrr.utils.utils import comb_indexes
+from clutrr.utils.utils import comb_index_groups
 from clutrr.relations.templator import Templator
 import copy
-import networkx as nx
-import matplotlib.pyplot as plt
-import numpy as np
 
 class Fact:
     """
@@ -48,7 +45,8 @@ class Puzzle:
                  proof=None,
                  query_edge=None,
                  ancestry=None,
-                 relations_obj=None
+                 relations_obj=None,
+                 edge_rels=None
                  ):
         """
 
@@ -59,6 +57,8 @@ class Puzzle:
         :param query_edge: edge to query, usually the same as target_edge
         :param ancestry: full background graph the story was derived from
         :param relations_obj: store of the rule base of the relations
+        :param edge_rels: precomputed edge -> relation table of the ancestry state,
+            shared between the puzzles of the same state
         """
         if id is None:
             self.id = str(uuid.uuid4())
@@ -71,6 +71,7 @@ class Puzzle:
         self.query_edge = query_edge
         self.anc = ancestry
         self.relations_obj = relations_obj
+        self.edge_rels = edge_rels if edge_rels is not None else {}
 
         # derived values
         self.query_text = None
@@ -92,7 +93,7 @@ class Puzzle:
         self.query_text = self.format_edge(self.target_edge)
         self.target_edge_rel = self.get_edge_relation(self.target_edge)
         self.story_rel = [self.format_edge_rel(story) for story in self.story]
-        self.relation_comb =  '-'.join([self.get_edge_rel(x)['rel'] for x in self.story])
+        self.relation_comb =  '-'.join([self.get_edge_relation(x) for x in self.story])
 
     def add_fact(self, fact_type, fact):
         """
@@ -110,15 +111,16 @@ class Puzzle:
         """
         self.facts = []
 
-    def get_full_story(self, randomize=True):
+    def get_full_story(self, randomize=True, rng=random):
         """
         Combine story and facts
         :param randomize:
+        :param rng: random stream to shuffle with
         :return:
         """
         full_story = self.story + [edge for fact in self.facts for edge in fact.fact_edges]
         if randomize:
-            full_story = random.sample(full_story, len(full_story))
+            full_story = rng.sample(full_story, len(full_story))
         return full_story
 
     def get_all_noise(self):
@@ -135,13 +137,16 @@ class Puzzle:
         """
         return self.story
 
-    def generate_text(self, stype='story', combination_length=1, templator:Templator=None, edges=None):
+    def generate_text(self, stype='story', combination_length=1, templator:Templator=None, edges=None,
+                      relations=None, rng=random):
         """
 
         :param stype: can be story, fact, target, or query
         :param combination_length: the max length of combining the edges for text replacement
         :param templator: templator class
         :param edges: if provided, use these edges instead of stypes
+        :param relations: if provided, the relations of the edges to convert, in the same order
+        :param rng: random stream to choose the generated row with
         :return:
         """
         generated_rows = []
@@ -162,13 +167,15 @@ class Puzzle:
         else:
             edges_to_convert = edges
 
-        combined_edges = comb_indexes(edges_to_convert, combination_length)
-        for comb_group in combined_edges:
-            r_combs = ['-'.join([self.get_edge_relation(edge) for edge in edge_group])
-                       for edge_group in comb_group]
+        if relations is None:
+            relations = [self.get_edge_relation(edge) for edge in edges_to_convert]
+        combined_idx = comb_index_groups(len(edges_to_convert), combination_length)
+        for comb_group in combined_idx:
+            r_combs = ['-'.join([relations[i] for i in idx_group])
+                       for idx_group in comb_group]
             # typo unfix for "neice niece"
             r_combs = [r.replace('niece','neice') if 'niece' in r else r for r in r_combs ]
-            r_entities = [[ent for edge in edge_group for ent in edge] for edge_group
+            r_entities = [[ent for i in idx_group for ent in edges_to_convert[i]] for idx_group
                           in comb_group]
             prows = [templator.replace_template(edge_group, r_entities[group_id])
                      for group_id, edge_group in enumerate(r_combs)]
@@ -187,7 +194,7 @@ class Puzzle:
                 # assert
                 raise AssertionError()
         if len(generated_rows) > 0:
-            generated_row = random.choice(generated_rows)
+            generated_row = rng.choice(generated_rows)
             for g in generated_row:
                 if type(g) != str:
                     import ipdb; ipdb.set_trace()
@@ -273,6 +280,11 @@ class Puzzle:
         return self.get_edge_relation(self.target_edge)
 
     def get_edge_rel(self, edge, rel_type='family'):
+        if rel_type == 'family':
+            try:
+                return self.edge_rels[edge]
+            except KeyError:
+                pass
         # get node attributes
         node_b_attr = self.anc.family_data[edge[1]]
         relation = self.anc.family[edge][rel_type]
@@ -280,10 +292,7 @@ class Puzzle:
         return edge_rel
 
     def get_edge_relation(self, edge, rel_type='family'):
-        node_b_attr = self.anc.family_data[edge[1]]
-        relation = self.anc.family[edge][rel_type]
-        edge_rel = self.relations_obj[relation][node_b_attr.gender]
-        return edge_rel['rel']
+        return self.get_edge_rel(edge, rel_type)['rel']
 
     def format_edge(self, edge):
         """
@@ -325,6 +334,9 @@ class Puzzle:
         Display the puzzle in a network diagram
         :return:
         """
+        # plotting libraries are only needed here, keep them out of the import of the module
+        import networkx as nx
+        import matplotlib.pyplot as plt
         G = nx.MultiDiGraph()
         fs = self.get_full_story()
         names = {}
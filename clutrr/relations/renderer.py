@@ -0,0 +1,128 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Render puzzles into dataset rows
+import random
+
+# output columns of a dataset row
+COLUMNS = ['id', 'story', 'query', 'text_query', 'target', 'text_target', 'clean_story', 'proof_state', 'f_comb',
+           'task_name', 'story_edges', 'edge_types', 'query_edge', 'genders', 'syn_story', 'node_mapping',
+           'task_split']
+# rendered rows also carry the noise type of each edge of story_edges, 'story' for the
+# edges of the story, which is only used by the tensor export
+EDGE_NOISE_COL = 'edge_noise'
+ROW_COLUMNS = COLUMNS + [EDGE_NOISE_COL]
+
+
+class PuzzleRenderer:
+    """
+    Render puzzles into the output columns, one batch at a time
+
+    Per puzzle, the story and fact edge lists, their relations and the node id mapping
+    are computed once and shared by all the columns. Templators are created once per
+    ancestry state and split, and shared by all puzzles of the batch derived from it.
+    """
+    def __init__(self, train_templates, test_templates, templator_class,
+                 query_templates, query_templator_class, combination_length=1, task_name='', rng=None):
+        """
+
+        :param train_templates: templates to use for train puzzles
+        :param test_templates: templates to use for test puzzles
+        :param templator_class: Templator class for the story
+        :param query_templates: templates for the query
+        :param query_templator_class: Templator class for the query
+        :param combination_length: the max length of combining the edges for text replacement
+        :param task_name: name of the task, stored in each row
+        :param rng: random stream used to render
+        """
+        self.templates = {'train': train_templates, 'test': test_templates}
+        self.templator_class = templator_class
+        self.query_templates = query_templates
+        self.query_templator_class = query_templator_class
+        self.combination_length = combination_length
+        self.task_name = task_name
+        self.rng = rng if rng is not None else random
+
+    def _templator(self, cache, task_split, family):
+        key = (task_split, id(family))
+        if key not in cache:
+            if task_split == 'query':
+                cache[key] = self.query_templator_class(templates=self.query_templates, family=family,
+                                                        rng=self.rng)
+            else:
+                cache[key] = self.templator_class(templates=self.templates[task_split], family=family,
+                                                  rng=self.rng)
+        return cache[key]
+
+    def render(self, puzzle, task_split, templators=None):
+        """
+        Render a single puzzle
+        :param puzzle: Puzzle
+        :param task_split: train / test
+        :param templators: templator cache, shared within a batch
+        :return: list of values, in the order of ``ROW_COLUMNS``
+        """
+        if task_split not in self.templates:
+            raise AssertionError("pid must be either in train or test")
+        if templators is None:
+            templators = {}
+        family = puzzle.anc.family_data
+        templator = self._templator(templators, task_split, family)
+        story_edges = puzzle.story
+        fact_edges = puzzle.get_all_noise()
+        story_rels = [puzzle.get_edge_relation(edge) for edge in story_edges]
+        fact_rels = [puzzle.get_edge_relation(edge) for edge in fact_edges]
+
+        story_text = puzzle.generate_text(stype='story', combination_length=self.combination_length,
+                                          templator=templator, edges=story_edges, relations=story_rels,
+                                          rng=self.rng)
+        fact_text = puzzle.generate_text(stype='fact', combination_length=self.combination_length,
+                                         templator=templator, edges=fact_edges, relations=fact_rels,
+                                         rng=self.rng)
+        story = story_text + fact_text
+        story = self.rng.sample(story, len(story))
+        story = ' '.join(story)
+        clean_story = ' '.join(story_text)
+        target_text = puzzle.generate_text(stype='target', combination_length=1, templator=templator,
+                                           rng=self.rng)
+
+        # Build query text
+        query_templator = self._templator(templators, 'query', family)
+        query_text = puzzle.generate_text(stype='query', combination_length=1, templator=query_templator,
+                                          rng=self.rng)
+        query_text = ' '.join(query_text)
+        query_text = query_text.replace('?.', '?')  # remove trailing '.'
+
+        # sorted node ids, in the order of appearance in the story, then the facts
+        node_mapping = puzzle.story_sort_dict
+        all_edges = story_edges + fact_edges
+        for a, b in all_edges:
+            if a not in node_mapping:
+                node_mapping[a] = len(node_mapping)
+            if b not in node_mapping:
+                node_mapping[b] = len(node_mapping)
+        story_keys_changed_ids = [(node_mapping[a], node_mapping[b]) for a, b in all_edges]
+        query_edge = puzzle.get_sorted_query_edge()
+        genders = puzzle.get_name_gender_string()
+        edge_noise = ['story'] * len(story_edges) + [fact.fact_type for fact in puzzle.facts
+                                                     for _ in fact.fact_edges]
+
+        return [puzzle.id, story, puzzle.query_text, query_text, puzzle.target_edge_rel, target_text,
+                clean_story, puzzle.proof_trace, puzzle.relation_comb, self.task_name, story_keys_changed_ids,
+                story_rels + fact_rels, query_edge, genders, '', node_mapping, task_split, edge_noise]
+
+    def render_batch(self, puzzles, splits):
+        """
+        Render a batch of puzzles
+        :param puzzles: list of Puzzle
+        :param splits: list of train / test, one per puzzle
+        :return: list of rows
+        """
+        templators = {}
+        return [self.render(puzzle, task_split, templators) for puzzle, task_split in zip(puzzles, splits)]
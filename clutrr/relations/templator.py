@@ -14,9 +14,10 @@ class Templator:
     """
     Templator base class
     """
-    def __init__(self, templates, family):
+    def __init__(self, templates, family, rng=None):
         self.templates = copy.copy(templates)
         self.family = family # dict containing node informations
+        self.rng = rng if rng is not None else random # random stream to choose templates
         self.used_template = ''
         self.entity_id_dict = {}
         self.seen_ent = set()
@@ -32,8 +33,8 @@ class TemplatorAMT(Templator):
     """
     Replaces story with the templates obtained from AMT
     """
-    def __init__(self, templates, family):
-        super(TemplatorAMT, self).__init__(templates=templates, family=family)
+    def __init__(self, templates, family, rng=None):
+        super(TemplatorAMT, self).__init__(templates=templates, family=family, rng=rng)
 
     def choose_template(self, f_comb, entities, verbose=False):
         """
@@ -57,7 +58,7 @@ class TemplatorAMT(Templator):
         if gender_comb not in self.templates[f_comb] or len(self.templates[f_comb][gender_comb]) == 0:
             raise NotImplementedError("template combination not found.")
         available_templates = self.templates[f_comb][gender_comb]
-        chosen_template = random.choice(available_templates)
+        chosen_template = self.rng.choice(available_templates)
         self.used_template = chosen_template
         used_i = self.templates[f_comb][gender_comb].index(chosen_template)
         # remove the used template
@@ -85,8 +86,8 @@ class TemplatorSynthetic(Templator):
     Replaces story with the templates obtained from Synthetic rule base
     Here, templates is self.relations_obj[relation]
     """
-    def __init__(self, templates, family):
-        super(TemplatorSynthetic, self).__init__(templates=templates, family=family)
+    def __init__(self, templates, family, rng=None):
+        super(TemplatorSynthetic, self).__init__(templates=templates, family=family, rng=rng)
 
     def choose_template(self, f_comb, entities, verbose=False):
         """
@@ -96,7 +97,7 @@ class TemplatorSynthetic(Templator):
         self.entity_id_dict = {}
         self.seen_ent = set()
         available_templates = self.templates[f_comb]
-        chosen_template = random.choice(available_templates)
+        chosen_template = self.rng.choice(available_templates)
         self.used_template = chosen_template
         return chosen_template
 
@@ -9,31 +9,171 @@
 
 import os
 import json
+import hashlib
+import pickle as pkl
 import yaml
 
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+from clutrr.store.template_store import file_sha256
+from clutrr.utils.tensors import relation_vocab
+
+CACHE_PREFIX = 'store_cache'
+
+# process wide cache of stores, keyed by the store files with their mtime and size
+_STORES = {}
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict
+    Stores are shared by all the tasks, shards and workers of a process, so they must not be
+    modified. Being immutable, frozen values are never copied by copy / deepcopy.
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("store values are read only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(obj):
+    """
+    Recursively convert dicts to FrozenDict, lists to tuples and sets to frozensets
+    :param obj: parsed json / yaml
+    :return:
+    """
+    if isinstance(obj, dict):
+        return FrozenDict((key, freeze(val)) for key, val in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(val) for val in obj)
+    if isinstance(obj, set):
+        return frozenset(obj)
+    return obj
+
+
+def load_yaml(path):
+    with open(path) as fp:
+        return yaml.load(fp, Loader=YamlLoader)
+
+
+def store_paths(args):
+    """
+    Locations of the attribute, relations, question and rules store files
+    :param args:
+    :return: tuple of paths
+    """
+    attribute_store = args.attribute_store if args.attribute_store else 'attribute_store.json'
+    relations_store = args.relations_store if args.relations_store else 'relations_store.json'
+    question_store = args.question_store if args.question_store else 'question_store.json'
+    rules_store = args.rules_store if args.rules_store else 'rules_store.yaml'
+    base_path = os.path.dirname(os.path.realpath(__file__)).split('store')[0]
+    return tuple(os.path.join(base_path, 'store', fl) for fl in
+                 (attribute_store, relations_store, question_store, rules_store))
+
+
 class Store:
-    def __init__(self,args):
-        attribute_store = args.attribute_store if args.attribute_store else 'attribute_store.json'
-        relations_store = args.relations_store if args.relations_store else 'relations_store.json'
-        question_store = args.question_store if args.question_store else 'question_store.json'
-        rules_store = args.rules_store if args.rules_store else 'rules_store.yaml'
+    def __init__(self,args, cache=True):
+        """
+
+        :param args:
+        :param cache: if True, build / reuse a pickle of the parsed files next to them
+        """
         self.base_path = os.path.dirname(os.path.realpath(__file__)).split('store')[0]
-        self.attribute_store = json.load(open(os.path.join(self.base_path, 'store', attribute_store)))
-        self.relations_store = yaml.load(open(os.path.join(self.base_path, 'store', relations_store)))
-        self.question_store = yaml.load(open(os.path.join(self.base_path, 'store', question_store)))
-        self.rules_store = yaml.load(open(os.path.join(self.base_path, 'store', rules_store)))
+        self.paths = store_paths(args)
+        parsed = self._load(cache)
+        self.attribute_store = parsed['attribute_store']
+        self.relations_store = parsed['relations_store']
+        self.question_store = parsed['question_store']
+        self.rules_store = parsed['rules_store']
 
         # TODO: do we need this?
         ## Relationship type has basic values 0,1 and 2, whereas the
         ## rest should be inferred. Like, child + child = 4 = grand
-        self.relationship_type = {
+        self.relationship_type = FrozenDict({
             'SO': 1,
             'child': 2,
             'sibling': 0,
             'in-laws': 3,
             'grand': 4,
             'no-relation': -1
-        }
+        })
 
         attr_names = [v["options"] for k,v in self.attribute_store.items()]
-        self.attr_names = set([x for p in attr_names for x in p])
\ No newline at end of file
+        self.attr_names = frozenset([x for p in attr_names for x in p])
+        # fixed relation ids, in the order of the relations store
+        self.relation_vocab = relation_vocab(self.relations_store)
+
+    def _parse(self):
+        attribute_path, relations_path, question_path, rules_path = self.paths
+        with open(attribute_path) as fp:
+            attribute_store = json.load(fp)
+        return {
+            'attribute_store': freeze(attribute_store),
+            'relations_store': freeze(load_yaml(relations_path)),
+            'question_store': freeze(load_yaml(question_path)),
+            'rules_store': freeze(load_yaml(rules_path)),
+        }
+
+    def _load(self, cache):
+        """
+        Parse the store files, or load them from the pickle cache
+        The cache is keyed by the content hash of the files
+        :param cache:
+        :return: dict of parsed stores
+        """
+        if not cache:
+            return self._parse()
+        sha = hashlib.sha256(''.join(file_sha256(path) for path in self.paths).encode('utf-8')).hexdigest()
+        cache_path = os.path.join(os.path.dirname(self.paths[0]), '{}.{}.pkl'.format(CACHE_PREFIX, sha[:16]))
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as fp:
+                return pkl.load(fp)
+        parsed = self._parse()
+        tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as fp:
+                pkl.dump(parsed, fp, protocol=pkl.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # store folder is read only, keep the parsed files
+            pass
+        return parsed
+
+    def __copy__(self):
+        # the store is read only and shared, eg by the deep copies of an ancestry
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def get_store(args, cache=True):
+    """
+    Return the Store for the store files given in args
+    Stores are memoized per process, and reloaded if one of the files changes on disk
+    :param args:
+    :param cache: build / reuse the pickle cache of the parsed files
+    :return: Store
+    """
+    key = [cache]
+    for path in store_paths(args):
+        st = os.stat(path)
+        key.append((path, st.st_mtime_ns, st.st_size))
+    key = tuple(key)
+    if key not in _STORES:
+        _STORES[key] = Store(args, cache=cache)
+    return _STORES[key]
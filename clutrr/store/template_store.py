@@ -0,0 +1,197 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Indexed, lazily loaded access to the AMT placeholder files
+# The placeholder json is parsed once and converted into a binary index, which is
+# cached next to the source file and keyed by the content hash of the json.
+# Each f_comb bucket is pickled separately, so only the buckets which are
+# actually used by a run are ever deserialized.
+# The json can also be read from inside a zip archive, as `<archive>::<member>`, in which
+# case the index is cached next to the archive and keyed by the crc of the member.
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import zipfile
+import pickle as pkl
+
+MAGIC = b'CLTRTPL1'
+HEADER = struct.Struct('<8sQ')
+CACHE_EXT = '.idx'
+ARCHIVE_SEP = '::'
+
+# process wide cache of opened template stores, keyed by (path, mtime, size)
+_TEMPLATE_STORES = {}
+
+
+def file_sha256(path, buf_size=65536):
+    """
+    Compute the sha256 of a file
+    :param path:
+    :param buf_size:
+    :return: hex digest
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(buf_size)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+
+def split_archive_path(path):
+    """
+    Split a `<archive>::<member>` path
+    :param path:
+    :return: archive path or None, member path
+    """
+    if ARCHIVE_SEP in path:
+        archive, member = path.split(ARCHIVE_SEP, 1)
+        return archive, member
+    return None, path
+
+
+def build_index(templates, out_path):
+    """
+    Convert a parsed template dict into the binary index format
+    Layout : MAGIC | header length | pickled {f_comb: (offset, length)} | buckets
+    Offsets are relative to the start of the bucket section
+    :param templates: dict f_comb -> gender_comb -> list of templates
+    :param out_path: location of the index file
+    :return:
+    """
+    offsets = {}
+    buckets = []
+    pos = 0
+    for f_comb, bucket in templates.items():
+        data = pkl.dumps(bucket, protocol=pkl.HIGHEST_PROTOCOL)
+        offsets[f_comb] = (pos, len(data))
+        buckets.append(data)
+        pos += len(data)
+    header = pkl.dumps(offsets, protocol=pkl.HIGHEST_PROTOCOL)
+    tmp_path = '{}.{}.tmp'.format(out_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for data in buckets:
+            f.write(data)
+    # atomic, so that concurrent runs never see a partial index
+    os.replace(tmp_path, out_path)
+
+
+class TemplateStore:
+    """
+    Read-only mapping of f_comb -> gender_comb -> list of templates, backed by
+    the binary index. Buckets are unpickled on first access and memoized.
+    """
+    def __init__(self, path, cache=True):
+        """
+
+        :param path: location of the placeholder json file, or `<archive>::<member>`
+        :param cache: if True, build / reuse the binary index next to the json file
+        """
+        self.path = path
+        self.archive, self.member = split_archive_path(path)
+        if self.archive:
+            # crc and size from the central directory, no need to read the member
+            with zipfile.ZipFile(self.archive) as zf:
+                info = zf.getinfo(self.member)
+            self.sha = '{:08x}{:08x}'.format(info.CRC, info.file_size)
+            index_base = '{}.{}'.format(self.archive, os.path.basename(self.member))
+        else:
+            self.sha = file_sha256(path)
+            index_base = path
+        self.index_path = None
+        self._offsets = {}
+        self._buckets = {}
+        self._mm = None
+        self._base = 0
+        if cache:
+            self.index_path = '{}.{}{}'.format(index_base, self.sha[:16], CACHE_EXT)
+            if not os.path.exists(self.index_path):
+                try:
+                    build_index(self._parse(), self.index_path)
+                except OSError:
+                    # source folder is read only, fall back to the parsed json
+                    self.index_path = None
+        if self.index_path:
+            self._open_index()
+        else:
+            self._buckets = self._parse()
+            self._offsets = {k: None for k in self._buckets}
+
+    def _parse(self):
+        if self.archive:
+            with zipfile.ZipFile(self.archive) as zf:
+                return json.loads(zf.read(self.member).decode('utf-8'))
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _open_index(self):
+        with open(self.index_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a template index".format(self.index_path))
+        self._offsets = pkl.loads(self._mm[HEADER.size:HEADER.size + header_len])
+        self._base = HEADER.size + header_len
+
+    def __getitem__(self, f_comb):
+        if f_comb not in self._buckets:
+            offset, length = self._offsets[f_comb]
+            start = self._base + offset
+            self._buckets[f_comb] = pkl.loads(self._mm[start:start + length])
+        return self._buckets[f_comb]
+
+    def __contains__(self, f_comb):
+        return f_comb in self._offsets
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def keys(self):
+        return self._offsets.keys()
+
+    def get(self, f_comb, default=None):
+        if f_comb in self._offsets:
+            return self[f_comb]
+        return default
+
+    def __copy__(self):
+        # the store is read only, templators can share it
+        return self
+
+
+def load_templates(path, cache=True):
+    """
+    Return the TemplateStore for the given placeholder json
+    Stores are memoized per process, and re-opened if the file changes on disk
+    :param path: json file, or `<archive>::<member>`
+    :param cache: build / reuse the binary index
+    :return: TemplateStore
+    """
+    archive, member = split_archive_path(path)
+    if archive:
+        archive = os.path.abspath(archive)
+        path = archive + ARCHIVE_SEP + member
+        st = os.stat(archive)
+    else:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size, cache)
+    if key not in _TEMPLATE_STORES:
+        _TEMPLATE_STORES[key] = TemplateStore(path, cache=cache)
+    return _TEMPLATE_STORES[key]
@@ -0,0 +1,171 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Run a sweep of data generation jobs on a bounded pool of processes
+# The manifest lists one job per line, given as the arguments of main.py. Shell scripts
+# such as run.sh can be used as is: `python main.py` prefixes, output redirections and
+# `&` are stripped, comments are skipped, and `export VAR=value` lines are used to expand
+# the variables of the following lines.
+# The placeholders, stores and templates are loaded once in the sweep process, and each
+# job runs in a process forked from it, so jobs do not pay the start-up again.
+#
+# Usage, from the clutrr/clutrr folder:
+#   python sweep.py run.sh --jobs 4
+
+import argparse
+import os
+import re
+import shlex
+import sys
+import time
+import traceback
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+from clutrr.args import get_args
+from clutrr.main import Clutrr, logger, logPath
+from clutrr.store.store import get_store
+from clutrr.generator import load_task_templates
+
+VAR_RE = re.compile(r'\$\{?(\w+)\}?')
+
+
+def parse_manifest(path):
+    """
+    Read the jobs of a manifest
+    :param path: manifest file
+    :return: list of (line number, list of main.py arguments)
+    """
+    env = dict(os.environ)
+    jobs = []
+    with open(path) as fp:
+        for line_no, line in enumerate(fp, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('export '):
+                key, _, val = line[len('export '):].partition('=')
+                env[key.strip()] = val.strip().strip('"\'')
+                continue
+            line = VAR_RE.sub(lambda m: env.get(m.group(1), m.group(0)), line)
+            tokens = shlex.split(line, comments=True)
+            if tokens and tokens[0].startswith('python'):
+                tokens = tokens[1:]
+            if tokens and tokens[0].endswith('main.py'):
+                tokens = tokens[1:]
+            # drop redirections and background markers
+            for i, tok in enumerate(tokens):
+                if tok in ('&', ';') or re.match(r'^\d*[<>]', tok):
+                    tokens = tokens[:i]
+                    break
+            if not tokens or not tokens[0].startswith('-'):
+                # other shell commands, eg `wait`
+                continue
+            jobs.append((line_no, tokens))
+    return jobs
+
+
+def _run_job(conn, clutrr, store, log_file):
+    """
+    Run a job in a forked process, with its output redirected to its log file
+    :param conn: pipe to send (status, result) back
+    :param clutrr: Clutrr instance of the job
+    :param store: pre-loaded Store
+    :param log_file: path of the log file, or None to keep the output
+    :return:
+    """
+    if log_file is not None:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+    try:
+        directory = clutrr.run_task(store=store)
+        conn.send(('done', directory))
+    except Exception:
+        traceback.print_exc()
+        conn.send(('failed', traceback.format_exc().strip().split('\n')[-1]))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    conn.close()
+
+
+def run_sweep(jobs, num_workers=1, log_dir=None):
+    """
+    Run the jobs, at most ``num_workers`` at a time
+    :param jobs: list of (name, args)
+    :param num_workers: max number of concurrent jobs
+    :param log_dir: folder of the per job log files, None to keep the output
+    :return: list of (name, status, seconds, dataset folder or error), in the order of jobs
+    """
+    # warm state, inherited by all the jobs
+    clutrrs = []
+    for name, args in jobs:
+        clutrr = Clutrr(args)
+        get_store(args)
+        if args.use_mturk_template:
+            load_task_templates(clutrr.args)
+        clutrrs.append(clutrr)
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    ctx = mp.get_context('fork')
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs)))
+    running = {}  # sentinel -> (job index, process, pipe, start time)
+    while pending or running:
+        while pending and len(running) < num_workers:
+            i = pending.pop(0)
+            log_file = None
+            if log_dir is not None:
+                log_file = os.path.join(log_dir, 'sweep_{}.log'.format(i))
+            reader, writer = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_run_job,
+                               args=(writer, clutrrs[i], get_store(clutrrs[i].args), log_file))
+            proc.start()
+            writer.close()
+            running[proc.sentinel] = (i, proc, reader, time.time())
+            logger.info("Started job {} : {}".format(i, jobs[i][0]))
+        for sentinel in wait(list(running.keys())):
+            i, proc, reader, start = running.pop(sentinel)
+            status, info = 'crashed', None
+            if reader.poll():
+                status, info = reader.recv()
+            proc.join()
+            if status == 'crashed':
+                info = 'exit code {}'.format(proc.exitcode)
+            results[i] = (jobs[i][0], status, time.time() - start, info)
+            logger.info("Job {} {} in {:.1f}s : {}".format(i, status, results[i][2], info))
+    return results
+
+
+def print_summary(results, total_time):
+    print("{:<4} {:<8} {:>9}  {}".format('job', 'status', 'time (s)', 'dataset / error'))
+    for i, (name, status, seconds, info) in enumerate(results):
+        print("{:<4} {:<8} {:>9.1f}  {}".format(i, status, seconds, info))
+        print("     {}".format(name))
+    num_done = len([r for r in results if r[1] == 'done'])
+    print("{} / {} jobs done in {:.1f}s".format(num_done, len(results), total_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest", type=str, help='File with one job per line, as main.py arguments (eg run.sh)')
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help='Max number of concurrent jobs')
+    parser.add_argument("--log_dir", type=str, default=logPath,
+                        help='Folder of the per job log files, empty to keep the output of the jobs')
+    sweep_args = parser.parse_args()
+    start = time.time()
+    jobs = [(shlex.join(tokens), get_args(tokens)) for line_no, tokens in parse_manifest(sweep_args.manifest)]
+    logger.info("Running {} jobs from {}, {} at a time".format(len(jobs), sweep_args.manifest, sweep_args.jobs))
+    results = run_sweep(jobs, num_workers=max(sweep_args.jobs, 1), log_dir=sweep_args.log_dir or None)
+    print_summary(results, time.time() - start)
+    sys.exit(0 if all(r[1] == 'done' for r in results) else 1)
@@ -0,0 +1,103 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Checkpoint and resume of streamed generation runs
+# A checkpoint is a single pickle holding the state of the run: the dataset folder, the
+# writer state, the finished tasks and the generation state of the running task (pattern
+# counters, split assignments, shards with their random streams and pending puzzles).
+# It is saved right after a batch of rows is flushed, so the rows on disk always match
+# the checkpoint. Rerunning the same command loads it and continues from there.
+
+import os
+import time
+import pickle as pkl
+import hashlib
+import json
+
+# 2 : online split rounded down like generate_rows, older checkpoints hold a different split state
+# 3 : the --dedup filter is sized with a margin, older checkpoints hold a filter of another size
+CHECKPOINT_VERSION = 3
+# args which do not change the generated data
+IGNORED_ARGS = ('checkpoint', 'checkpoint_interval')
+
+
+def args_key(args):
+    """
+    Hash of the arguments of a run, used to match a checkpoint with its command
+    :param args:
+    :return: str
+    """
+    config = {k: v for k, v in vars(args).items() if k not in IGNORED_ARGS}
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class Checkpoint:
+    """
+    State of a generation run, saved atomically every ``interval`` seconds
+    """
+    def __init__(self, path, key, interval=300):
+        """
+
+        :param path: checkpoint file
+        :param key: args key of the run, see ``args_key``
+        :param interval: min number of seconds between two saves
+        """
+        self.path = path
+        self.key = key
+        self.interval = interval
+        self.state = {}
+        self.last_save = time.time()
+
+    @classmethod
+    def for_args(cls, args, directory):
+        """
+        Checkpoint of the given run, stored in the output directory
+        :param args:
+        :param directory: output directory
+        :return: Checkpoint
+        """
+        key = args_key(args)
+        path = os.path.join(directory, 'checkpoint_{}.pkl'.format(key))
+        return cls(path, key, interval=args.checkpoint_interval)
+
+    def load(self):
+        """
+        Load the saved state, if any
+        :return: state dict, or None if there is nothing to resume
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as fp:
+            saved = pkl.load(fp)
+        if saved.get('version') != CHECKPOINT_VERSION or saved.get('key') != self.key:
+            raise AssertionError("checkpoint {} does not match the current arguments".format(self.path))
+        self.state = saved['state']
+        return self.state
+
+    def update(self, **kwargs):
+        self.state.update(kwargs)
+
+    def due(self):
+        return time.time() - self.last_save >= self.interval
+
+    def save(self):
+        """
+        Write the state to a temp file and move it in place, so that a crash while saving
+        leaves the previous checkpoint intact
+        :return:
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            pkl.dump({'version': CHECKPOINT_VERSION, 'key': self.key, 'state': self.state}, fp, protocol=-1)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.time()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,130 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Column oriented row buffers
+# Rows are partitioned by (task_split, task_name) when they are appended, so that
+# the train / test files can be written partition by partition without
+# re-scanning, filtering or concatenating the whole dataset.
+# The buffers are plain lists: every column of ROW_COLUMNS holds strings, tuples or nested
+# lists (edges, relations, node mapping), there is no int / float column to pack in an array.
+
+SPLIT_COL = 'task_split'
+TASK_COL = 'task_name'
+
+
+class ColumnBuffer:
+    """
+    Per column append buffers of a single partition
+    The partition key columns are constant within a partition and are not stored per row
+    """
+    def __init__(self, columns, task_split, task_name):
+        self.columns = columns
+        self.task_split = task_split
+        self.task_name = task_name
+        self.data = {col: [] for col in columns if col not in (SPLIT_COL, TASK_COL)}
+        self.num_rows = 0
+
+    def append(self, row):
+        """
+        :param row: list of values in the order of ``columns``
+        :return:
+        """
+        for col, val in zip(self.columns, row):
+            if col in self.data:
+                self.data[col].append(val)
+        self.num_rows += 1
+
+    def extend(self, other):
+        for col, vals in other.data.items():
+            self.data[col].extend(vals)
+        self.num_rows += other.num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, col):
+        if col == SPLIT_COL:
+            return [self.task_split] * self.num_rows
+        if col == TASK_COL:
+            return [self.task_name] * self.num_rows
+        return self.data[col]
+
+    def to_frame(self, columns=None):
+        """
+        :param columns: columns to keep, default all
+        :return: DataFrame
+        """
+        import pandas as pd
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({col: self.column(col) for col in columns}, columns=columns)
+
+
+class ColumnarRows:
+    """
+    Row builder with one ColumnBuffer per (task_split, task_name) partition
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._split_i = self.columns.index(SPLIT_COL)
+        self._task_i = self.columns.index(TASK_COL)
+        self.partitions = {}
+
+    def _partition(self, task_split, task_name):
+        key = (task_split, task_name)
+        if key not in self.partitions:
+            self.partitions[key] = ColumnBuffer(self.columns, task_split, task_name)
+        return self.partitions[key]
+
+    def append(self, row):
+        """
+        Append a row, list of values in the order of ``columns``
+        :param row:
+        :return:
+        """
+        self._partition(row[self._split_i], row[self._task_i]).append(row)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def merge(self, other):
+        """
+        Move the partitions of another builder into this one
+        :param other: ColumnarRows
+        :return:
+        """
+        for (task_split, task_name), part in other.partitions.items():
+            self._partition(task_split, task_name).extend(part)
+
+    def select(self, task_split, task_names=None):
+        """
+        Partitions of the given split, optionally restricted to a list of task names
+        :param task_split: train / test
+        :param task_names: list of task names, or None for all
+        :return: list of ColumnBuffer, in insertion order
+        """
+        return [part for (sp, tn), part in self.partitions.items()
+                if sp == task_split and (task_names is None or tn in task_names)]
+
+    def count(self, task_split=None):
+        return sum(len(part) for (sp, tn), part in self.partitions.items()
+                   if task_split is None or sp == task_split)
+
+    def __len__(self):
+        return self.count()
+
+    def rows(self):
+        """
+        Iterate over the rows as lists, partition by partition
+        :return:
+        """
+        for part in self.partitions.values():
+            cols = [part.column(col) for col in self.columns]
+            for i in range(len(part)):
+                yield [c[i] for c in cols]
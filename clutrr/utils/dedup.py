@@ -0,0 +1,286 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Deduplication and train / test leakage detection of the generated stories
+# Each puzzle gets a canonical fingerprint of its graph: story and noise edges with their
+# relations, the gender (and with `names`, the name) of each entity, the query edge and
+# the target. Node ids are replaced by Weisfeiler-Lehman colors, so two stories with the
+# same graph under a different numbering of the entities get the same fingerprint.
+# Fingerprints are kept in a Bloom filter, memory is set by the expected number of rows
+# and the false positive rate, and the filter can be a memory-mapped file for large runs.
+#
+# Leakage between the train and test files of existing datasets:
+#   python dedup.py <dataset folder> [<dataset folder> ...] --mode graph
+
+import argparse
+import ast
+import hashlib
+import math
+import mmap
+import os
+
+from clutrr.utils.formats import dataset_files, iter_frames
+
+DEDUP_MODES = ('story', 'graph')
+# the puzzles of a family tree are kept together, so a task generates more puzzles than its
+# rows (up to a third more in the 2.x tasks): the run filter is sized with this margin
+CAPACITY_MARGIN = 2
+
+
+def _digest(value, size=16):
+    return hashlib.blake2b(repr(value).encode('utf-8'), digest_size=size).digest()
+
+
+def graph_fingerprint(edges, relations, labels, query_edge, target):
+    """
+    Canonical fingerprint of a story graph
+    :param edges: list of (node, node)
+    :param relations: relation of each edge
+    :param labels: dict node -> label, eg its gender
+    :param query_edge: (node, node)
+    :param target: relation of the query
+    :return: bytes
+    """
+    nodes = set(labels)
+    for a, b in edges:
+        nodes.update((a, b))
+    roles = {query_edge[0]: 'q0', query_edge[1]: 'q1'}
+    colors = {node: _digest((labels.get(node), roles.get(node)), 8) for node in nodes}
+    num_colors = len(set(colors.values()))
+    # refine the colors with the neighbourhood of each node until the partition is stable
+    for _ in range(len(nodes)):
+        neighbours = {node: [] for node in nodes}
+        for (a, b), rel in zip(edges, relations):
+            neighbours[a].append(('out', rel, colors[b]))
+            neighbours[b].append(('in', rel, colors[a]))
+        colors = {node: _digest((colors[node], sorted(neighbours[node])), 8) for node in nodes}
+        if len(set(colors.values())) == num_colors:
+            break
+        num_colors = len(set(colors.values()))
+    edge_colors = sorted((colors[a], rel, colors[b]) for (a, b), rel in zip(edges, relations))
+    return _digest((edge_colors, colors[query_edge[0]], colors[query_edge[1]], target))
+
+
+def puzzle_fingerprint(puzzle, names=False):
+    """
+    Fingerprint of a generated puzzle, equal to the ``row_fingerprint`` of its rendered row
+    :param puzzle: Puzzle
+    :param names: if True, entities are labelled by name and gender, else by gender only
+    :return: bytes
+    """
+    edges = puzzle.story + puzzle.get_all_noise()
+    relations = [puzzle.get_edge_relation(edge) for edge in edges]
+    family = puzzle.anc.family_data
+    labels = {}
+    for a, b in edges + [puzzle.target_edge]:
+        for node in (a, b):
+            if node not in labels:
+                labels[node] = (family[node].name, family[node].gender) if names else family[node].gender
+    return graph_fingerprint(edges, relations, labels, puzzle.target_edge, puzzle.target_edge_rel)
+
+
+def _as_list(val):
+    # csv files store the lists as python reprs
+    if isinstance(val, str):
+        return ast.literal_eval(val)
+    return list(val)
+
+
+def row_fingerprint(story_edges, edge_types, genders, query_edge, target, names=False):
+    """
+    Fingerprint of a dataset row
+    :param story_edges: edges with the sorted node ids
+    :param edge_types: relation of each edge
+    :param genders: `name:gender` of each node, comma separated, in node id order
+    :param query_edge:
+    :param target:
+    :param names: see ``puzzle_fingerprint``
+    :return: bytes
+    """
+    labels = {}
+    for node, name_gender in enumerate(genders.split(',')):
+        name, gender = name_gender.rsplit(':', 1)
+        labels[node] = (name, gender) if names else gender
+    edges = [(int(a), int(b)) for a, b in _as_list(story_edges)]
+    query_edge = tuple(int(node) for node in _as_list(query_edge))
+    return graph_fingerprint(edges, list(_as_list(edge_types)), labels, query_edge, target)
+
+
+def frame_fingerprints(df, names=False):
+    return [row_fingerprint(*row, names=names) for row in zip(
+        df['story_edges'], df['edge_types'], df['genders'], df['query_edge'], df['target'])]
+
+
+class BloomFilter:
+    """
+    Bloom filter of fingerprints, in memory or in a memory-mapped file
+    """
+    def __init__(self, capacity, error_rate=1e-6, path=None):
+        """
+
+        :param capacity: expected number of fingerprints
+        :param error_rate: false positive rate at capacity
+        :param path: if given, the bits are stored in this file, reused if it exists
+        """
+        capacity = max(int(capacity), 1)
+        self.num_bits = max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        num_bytes = (self.num_bits + 7) // 8
+        self.path = path
+        if path is None:
+            self.bits = bytearray(num_bytes)
+        else:
+            with open(path, 'ab') as fp:
+                if fp.tell() < num_bytes:
+                    fp.truncate(num_bytes)
+            self.fp = open(path, 'r+b')
+            self.bits = mmap.mmap(self.fp.fileno(), num_bytes)
+
+    def _positions(self, fingerprint):
+        h1 = int.from_bytes(fingerprint[:8], 'little')
+        h2 = int.from_bytes(fingerprint[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, fingerprint):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(fingerprint))
+
+    def add(self, fingerprint):
+        """
+        :param fingerprint: bytes, at least 16
+        :return: True if the fingerprint was (probably) already in the filter
+        """
+        present = True
+        for pos in self._positions(fingerprint):
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                present = False
+        return present
+
+    def state(self):
+        return bytes(self.bits)
+
+    def restore(self, state):
+        self.bits[:] = state
+
+    def close(self):
+        if self.path is not None:
+            self.bits.flush()
+            self.bits.close()
+            self.fp.close()
+
+
+class Deduplicator:
+    """
+    Drop the puzzles whose fingerprint was already generated in the run, in any task or split
+    """
+    def __init__(self, capacity, error_rate=1e-6, mode='graph'):
+        """
+
+        :param capacity: expected number of puzzles of the run
+        :param error_rate: false positive rate, ie rate of unique puzzles dropped
+        :param mode: story to drop the same graph with the same names, graph to drop isomorphic
+            graphs whatever the names
+        """
+        if mode not in DEDUP_MODES:
+            raise AssertionError("unknown dedup mode {}, expected one of {}".format(mode, DEDUP_MODES))
+        self.names = mode == 'story'
+        self.filter = BloomFilter(capacity, error_rate)
+        self.dropped = 0
+
+    def fingerprint(self, puzzle):
+        return puzzle_fingerprint(puzzle, names=self.names)
+
+    def seen(self, fingerprint):
+        """
+        Add a fingerprint
+        :return: True if the puzzle is a duplicate and should be dropped
+        """
+        if self.filter.add(fingerprint):
+            self.dropped += 1
+            return True
+        return False
+
+    def state(self):
+        return self.filter.state(), self.dropped
+
+    def restore(self, state):
+        bits, self.dropped = state
+        self.filter.restore(bits)
+
+
+def _file_rows(directories):
+    # number of rows of each file from the stats.json sidecars, see stats.py
+    from clutrr.utils.stats import load_stats
+    rows = {}
+    for directory in directories:
+        try:
+            for fl_name, fl_stats in load_stats(directory).items():
+                rows[os.path.join(directory, fl_name)] = fl_stats['rows']
+        except (OSError, ValueError, KeyError):
+            continue
+    return rows
+
+
+def leakage_report(directories, mode='graph', error_rate=1e-4, capacity=None, index_path=None):
+    """
+    Count the test rows whose story graph appears in a train file, and the duplicates within
+    each file, over several dataset folders. Only the fingerprints are kept, in Bloom filters
+    :param directories: dataset folders
+    :param mode: see ``Deduplicator``
+    :param error_rate:
+    :param capacity: number of train rows, default from the stats.json sidecars. Each file
+        filter is sized from the rows of its file, or this capacity without a sidecar
+    :param index_path: if given, the train filter is a memory-mapped file at this path
+    :return: dict file path -> {'rows', 'duplicates', 'leaked'}, leaked is None for train files
+    """
+    if mode not in DEDUP_MODES:
+        raise AssertionError("unknown dedup mode {}, expected one of {}".format(mode, DEDUP_MODES))
+    names = mode == 'story'
+    train_files = [fl for directory in directories for fl in dataset_files(directory, '*_train')]
+    test_files = [fl for directory in directories for fl in dataset_files(directory, '*_test')]
+    file_rows = _file_rows(directories)
+    if not capacity:
+        if all(fl in file_rows for fl in train_files):
+            capacity = sum(file_rows[fl] for fl in train_files)
+        capacity = capacity or 10 ** 7
+    train_filter = BloomFilter(capacity, error_rate, path=index_path)
+    report = {}
+    for fl in train_files + test_files:
+        is_train = fl in train_files
+        file_filter = BloomFilter(file_rows.get(fl) or capacity, error_rate)
+        counts = {'rows': 0, 'duplicates': 0, 'leaked': None if is_train else 0}
+        for df in iter_frames(fl):
+            for fingerprint in frame_fingerprints(df, names=names):
+                counts['rows'] += 1
+                if file_filter.add(fingerprint):
+                    counts['duplicates'] += 1
+                if is_train:
+                    train_filter.add(fingerprint)
+                elif fingerprint in train_filter:
+                    counts['leaked'] += 1
+        report[fl] = counts
+    train_filter.close()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directories", type=str, nargs='+', help='Dataset folders')
+    parser.add_argument("--mode", type=str, default='graph', choices=DEDUP_MODES,
+                        help='story : same graph and names, graph : isomorphic graphs whatever the names')
+    parser.add_argument("--error_rate", type=float, default=1e-4, help='False positive rate of the filters')
+    parser.add_argument("--capacity", type=int, default=0,
+                        help='Expected number of rows per filter, default from the stats.json sidecars')
+    parser.add_argument("--index", type=str, default=None, help='Keep the train filter in this file')
+    args = parser.parse_args()
+    for fl, counts in leakage_report(args.directories, mode=args.mode, error_rate=args.error_rate,
+                                     capacity=args.capacity or None, index_path=args.index).items():
+        leaked = '' if counts['leaked'] is None else ', {} leaked from train'.format(counts['leaked'])
+        print("{} : {} rows, {} duplicates{}".format(os.path.relpath(fl), counts['rows'], counts['duplicates'], leaked))
@@ -0,0 +1,176 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Content addressing of the generated datasets
+# The fingerprint of a run hashes the arguments which change the generated data, the
+# contents of the store files, of the placeholders and of the pattern registry, so that it
+# does not depend on where they are located or on how the run is executed. It is saved in
+# config.json along with the sha256 of every file of the dataset. Seeded runs write into
+# `data_<fingerprint>`, and with `--reuse` a run whose fingerprint matches a complete and
+# intact dataset of the output dir returns that folder instead of generating it again.
+
+import os
+import glob
+import json
+import zipfile
+import hashlib
+
+from clutrr.generator import num_shards
+from clutrr.store.store import store_paths
+from clutrr.store.template_store import file_sha256, split_archive_path
+from clutrr.utils.reader import INDEX_EXT
+
+FINGERPRINT_VERSION = 2
+CONFIG_FILE = 'config.json'
+# arguments which do not change the generated data, which only set how the run is executed
+# (replaced by ``generation_mode``), or which are replaced by the hash of what they point to
+IGNORED_ARGS = ('output_dir', 'checkpoint_interval', 'write_queue', 'analyze', 'reuse',
+                'workers', 'task_workers', 'stream', 'stream_batch', 'shards', 'checkpoint',
+                'template_file', 'placeholder_path', 'attribute_store', 'relations_store', 'question_store',
+                'rules_store', 'pattern_registry', 'registry_name')
+TEMPLATE_SUFFIXES = ('.train.json', '.test.json', '.json')
+
+
+def template_hashes(template_file):
+    """
+    Hash of the placeholder files of a template prefix
+    :param template_file: `args.template_file`, a path prefix or `<archive>::<member prefix>`
+    :return: dict suffix -> hash, for the files which exist
+    """
+    archive, member = split_archive_path(template_file)
+    hashes = {}
+    if archive:
+        with zipfile.ZipFile(archive) as zf:
+            names = set(zf.namelist())
+            for suffix in TEMPLATE_SUFFIXES:
+                if member + suffix in names:
+                    info = zf.getinfo(member + suffix)
+                    hashes[suffix] = '{:08x}{:08x}'.format(info.CRC, info.file_size)
+    else:
+        for suffix in TEMPLATE_SUFFIXES:
+            if os.path.exists(template_file + suffix):
+                hashes[suffix] = file_sha256(template_file + suffix)
+    return hashes
+
+
+def generation_mode(args):
+    """
+    Generation path of the run, the only part of the execution flags which changes the data:
+    rows generated in one pass (``generate_rows``) or by shards (``stream_rows``, used with
+    --stream, --checkpoint or --workers), whose output only depends on the number of shards
+    :param args:
+    :return: dict
+    """
+    checkpoint = args.checkpoint and args.output_format != 'parquet'
+    if not (args.stream or checkpoint or args.workers > 1):
+        return {'stream': False, 'shards': None}
+    return {'stream': True, 'shards': num_shards(args)}
+
+
+def registry_snapshot(args):
+    """
+    Hash of the registry patterns read by the run, see ``PatternRegistry``
+    With --unique_test_pattern, the test tasks whose relation length has no train task
+    in the run are restricted to the patterns recorded in the registry
+    :param args:
+    :return: hex digest, or None if the run does not read the registry
+    """
+    if not (args.pattern_registry and args.unique_test_pattern):
+        return None
+    from clutrr.utils.registry import PatternRegistry, SPLITS
+    train_lengths = set(int(choice.split('.')[1]) for choice in args.train_tasks.split(','))
+    lengths = sorted(set(int(choice.split('.')[1]) for choice in args.test_tasks.split(',')) - train_lengths)
+    registry = PatternRegistry(args.pattern_registry)
+    registry_name = args.registry_name or args.data_name
+    digest = hashlib.sha256()
+    for relation_length in lengths:
+        for split in SPLITS:
+            for pattern in sorted(registry.patterns(registry_name, relation_length, split)):
+                digest.update('{}\x1f{}\x1f{}\n'.format(relation_length, split, pattern).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(args):
+    """
+    Fingerprint of the dataset generated by the given arguments
+    :param args:
+    :return: hex digest
+    """
+    config = {
+        'version': FINGERPRINT_VERSION,
+        'args': {k: v for k, v in vars(args).items() if k not in IGNORED_ARGS},
+        'mode': generation_mode(args),
+        'registry': registry_snapshot(args),
+        'stores': [file_sha256(path) for path in store_paths(args)],
+        # placeholders are only read by the mturk templator
+        'templates': template_hashes(args.template_file) if args.use_mturk_template else None,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def file_checksums(directory):
+    """
+    Sha256 of the files of a dataset folder, recursively, except config.json and the row
+    indexes, which are rebuilt by the reader when a file changes
+    :param directory:
+    :return: dict relative path -> hex digest
+    """
+    checksums = {}
+    for root, _, files in os.walk(directory):
+        for fl in files:
+            path = os.path.join(root, fl)
+            rel_path = os.path.relpath(path, directory)
+            if rel_path != CONFIG_FILE and not fl.endswith(INDEX_EXT):
+                checksums[rel_path] = file_sha256(path)
+    return {rel_path: checksums[rel_path] for rel_path in sorted(checksums)}
+
+
+def verify_checksums(directory, checksums):
+    """
+    :param directory:
+    :param checksums: see ``file_checksums``
+    :return: True if all the files exist with the same content
+    """
+    for rel_path, digest in checksums.items():
+        path = os.path.join(directory, rel_path)
+        if not os.path.isfile(path) or file_sha256(path) != digest:
+            return False
+    return True
+
+
+def _matches(directory, fingerprint):
+    try:
+        with open(os.path.join(directory, CONFIG_FILE)) as fp:
+            config = json.load(fp)
+    except (OSError, ValueError):
+        return False
+    return config.get('fingerprint') == fingerprint and 'checksums' in config and \
+        verify_checksums(directory, config['checksums'])
+
+
+def dataset_folder_name(fingerprint):
+    return 'data_{}'.format(fingerprint[:16])
+
+
+def find_dataset(output_path, fingerprint):
+    """
+    Complete and intact dataset of the output dir with the given fingerprint
+    The content addressed folder is checked first, then the other dataset folders, eg
+    written while the content addressed folder was taken
+    :param output_path: output dir
+    :param fingerprint:
+    :return: path of the dataset folder, or None
+    """
+    directory = os.path.join(output_path, dataset_folder_name(fingerprint))
+    if _matches(directory, fingerprint):
+        return directory
+    for directory in sorted(glob.glob(os.path.join(output_path, 'data_*'))):
+        if os.path.isdir(directory) and _matches(directory, fingerprint):
+            return directory
+    return None
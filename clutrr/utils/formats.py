@@ -0,0 +1,266 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Output formats of the dataset files
+# CSV files store the structured columns as python reprs, as in the original release.
+# JSONL and Parquet files store them with native types, so that they can be loaded
+# without `eval`:
+#   query, text_target, edge_types : list of strings
+#   story_edges, node_mapping      : list of [int, int] pairs
+#   query_edge                     : [int, int]
+#   proof_state                    : list of {conclusion: [name, relation, name],
+#                                             premises: list of [name, relation, name]}
+# Parquet needs pyarrow, it is only imported when the format is used.
+
+import os
+import glob
+import gzip
+import json
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl', 'parquet': '.parquet'}
+
+
+def file_extension(output_format, compression=''):
+    """
+    Extension of the dataset files
+    :param output_format: csv, jsonl or parquet
+    :param compression: gzip for csv / jsonl, parquet files are compressed internally
+    :return:
+    """
+    if output_format not in EXTENSIONS:
+        raise AssertionError("unknown output format {}, expected one of {}".format(output_format, FORMATS))
+    if output_format != 'parquet' and compression not in ('', 'gzip'):
+        raise AssertionError("{} files only support gzip compression".format(output_format))
+    ext = EXTENSIONS[output_format]
+    if compression and output_format != 'parquet':
+        ext += '.gz'
+    return ext
+
+
+def dataset_files(directory, pattern='*'):
+    """
+    Dataset files of a folder, in any output format
+    :param directory:
+    :param pattern: glob pattern of the file name without extension, eg ``*_test``
+    :return: sorted list of paths
+    """
+    files = []
+    for ext in EXTENSIONS.values():
+        for suffix in (ext, ext + '.gz'):
+            files.extend(glob.glob(os.path.join(directory, pattern + suffix)))
+    return sorted(files)
+
+
+def _pairs(values):
+    return [list(val) for val in values]
+
+
+def _proof_steps(proof):
+    return [{'conclusion': list(head), 'premises': _pairs(body)} for step in proof for head, body in step.items()]
+
+
+def _mapping(mapping):
+    return [[key, val] for key, val in mapping.items()]
+
+
+CONVERTERS = {
+    'query': list,
+    'text_target': list,
+    'proof_state': _proof_steps,
+    'story_edges': _pairs,
+    'edge_types': list,
+    'query_edge': list,
+    'node_mapping': _mapping,
+}
+
+
+def typed_column(col, values):
+    """
+    Convert the values of a column to native json / arrow types
+    :param col: column name
+    :param values: list of values as rendered
+    :return: list
+    """
+    convert = CONVERTERS.get(col)
+    if convert is None:
+        return list(values)
+    return [convert(val) for val in values]
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+    triple = pa.list_(pa.string())
+    pair = pa.list_(pa.int64())
+    types = {
+        'query': pa.list_(pa.string()),
+        'text_target': pa.list_(pa.string()),
+        'proof_state': pa.list_(pa.struct([('conclusion', triple), ('premises', pa.list_(triple))])),
+        'story_edges': pa.list_(pair),
+        'edge_types': pa.list_(pa.string()),
+        'query_edge': pair,
+        'node_mapping': pa.list_(pair),
+    }
+    return pa.schema([(col, types.get(col, pa.string())) for col in columns])
+
+
+def encode_csv(columns, part, start):
+    """
+    :param columns:
+    :param part: ColumnBuffer
+    :param start: index of the first row in the file, the header is written if 0
+    :return: bytes
+    """
+    df = part.to_frame(columns)
+    df.index += start
+    return df.to_csv(header=start == 0).encode('utf-8')
+
+
+def encode_jsonl(columns, part, start):
+    values = [typed_column(col, part.column(col)) for col in columns]
+    return ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in zip(*values)).encode('utf-8')
+
+
+ENCODERS = {'csv': encode_csv, 'jsonl': encode_jsonl}
+
+
+def encode(output_format, columns, part, start, compression=''):
+    """
+    Serialize a partition for a csv / jsonl file
+    Gzip compressed batches are separate gzip members, which can be appended to each other
+    :param output_format: csv or jsonl
+    :param columns:
+    :param part: ColumnBuffer
+    :param start: index of the first row in the file
+    :param compression: '' or gzip
+    :return: bytes
+    """
+    data = ENCODERS[output_format](columns, part, start)
+    if compression:
+        data = gzip.compress(data, mtime=0)
+    return data
+
+
+class ParquetFileWriter:
+    """
+    Write partitions into a parquet file, in row groups of ``row_group_size`` rows
+    """
+    def __init__(self, path, columns, compression='', row_group_size=50000):
+        import pyarrow.parquet as pq
+        self.columns = list(columns)
+        self.schema = arrow_schema(self.columns)
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression or 'snappy')
+        self.pending = {col: [] for col in self.columns}
+        self.num_pending = 0
+
+    def write(self, part):
+        for col in self.columns:
+            self.pending[col].extend(typed_column(col, part.column(col)))
+        self.num_pending += len(part)
+        if self.num_pending >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+        if self.num_pending == 0:
+            return
+        table = pa.Table.from_pydict(self.pending, schema=self.schema)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.pending = {col: [] for col in self.columns}
+        self.num_pending = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def read_frame(path):
+    """
+    Load a dataset file into a DataFrame
+    :param path: csv, jsonl or parquet file, optionally gzip compressed
+    :return: DataFrame
+    """
+    import pandas as pd
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if '.jsonl' in os.path.basename(path):
+        return pd.read_json(path, lines=True, dtype=False)
+    return pd.read_csv(path)
+
+
+def iter_frames(path, chunksize=100000):
+    """
+    Load a dataset file chunk by chunk
+    Csv files are read with their index, so that it is kept by ``write_frame``
+    :param path: csv, jsonl or parquet file, optionally gzip compressed
+    :param chunksize: number of rows per chunk
+    :return: iterator of DataFrames
+    """
+    import pandas as pd
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif '.jsonl' in os.path.basename(path):
+        yield from pd.read_json(path, lines=True, dtype=False, chunksize=chunksize)
+    else:
+        yield from pd.read_csv(path, index_col=0, chunksize=chunksize)
+
+
+def write_frame(df, path):
+    """
+    Save a DataFrame in the format given by the file extension
+    :param df:
+    :param path:
+    :return:
+    """
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    elif '.jsonl' in os.path.basename(path):
+        df.to_json(path, orient='records', lines=True)
+    else:
+        df.to_csv(path)
+
+
+class FrameAppender:
+    """
+    Write DataFrames chunk by chunk into a file, in the format given by its extension
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fp = None
+        self.writer = None
+        self.num_rows = 0
+
+    def write(self, df):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            header = self.fp is None
+            if self.fp is None:
+                opener = gzip.open if self.path.endswith('.gz') else open
+                self.fp = opener(self.path, 'wt', encoding='utf-8', newline='')
+            if '.jsonl' in os.path.basename(self.path):
+                if len(df):
+                    self.fp.write(df.to_json(orient='records', lines=True).rstrip('\n') + '\n')
+            else:
+                df.to_csv(self.fp, header=header)
+        self.num_rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.fp is not None:
+            self.fp.close()
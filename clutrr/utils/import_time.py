@@ -0,0 +1,77 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Import time benchmark of the CLI and library modules
+# Each module is imported in a fresh interpreter with `python -X importtime`, the wall
+# time of the import is reported along with the slowest imported packages.
+# Heavy dependencies (pandas, nltk, requests, networkx, matplotlib) are expected to be
+# imported on first use only, and should not show up here.
+#
+# Usage:
+#   python import_time.py --modules clutrr.main,clutrr.generator --repeat 5 --max_seconds 1
+
+import argparse
+import os
+import subprocess
+import sys
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEAVY_MODULES = ('pandas', 'nltk', 'requests', 'networkx', 'matplotlib')
+
+
+def import_profile(module):
+    """
+    Import a module in a fresh interpreter
+    :param module: module name
+    :return: total import time in seconds, dict top level package -> cumulative seconds
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')]).rstrip(os.pathsep)
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                         env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                         universal_newlines=True, check=True).stderr
+    packages = {}
+    total = 0
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        cumulative = int(cumulative) / 1e6
+        # nested imports are indented, only count the outermost ones
+        if len(name) - len(name.lstrip(' ')) == 1:
+            top = name.strip().split('.')[0]
+            packages[top] = packages.get(top, 0) + cumulative
+            total += cumulative
+    return total, packages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", default='clutrr.main,clutrr.generator', type=str,
+                        help='Comma separated modules to import')
+    parser.add_argument("--repeat", default=5, type=int, help='Number of fresh imports per module')
+    parser.add_argument("--top", default=10, type=int, help='Number of slowest packages to show')
+    parser.add_argument("--max_seconds", default=0, type=float,
+                        help='If set, exit with an error when the median import time is above it')
+    args = parser.parse_args()
+    failed = False
+    for module in args.modules.split(','):
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        median = statistics.median([total for total, _ in runs])
+        packages = runs[-1][1]
+        heavy = sorted(set(packages) & set(HEAVY_MODULES))
+        print("{} : median import time {:.3f}s over {} runs".format(module, median, args.repeat))
+        for name, seconds in sorted(packages.items(), key=lambda x: -x[1])[:args.top]:
+            print("    {:<24} {:.3f}s".format(name, seconds))
+        if heavy:
+            print("    heavy dependencies imported eagerly : {}".format(', '.join(heavy)))
+        if args.max_seconds and median > args.max_seconds:
+            failed = True
+    sys.exit(1 if failed else 0)
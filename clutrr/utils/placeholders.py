@@ -0,0 +1,289 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Offline-first cache of the AMT placeholder archive
+# Downloaded archives are stored under their sha256, `<cache>/<sha>.zip`, next to a
+# manifest `<cache>/<sha>.json` with the hash of every file of the archive. The archive
+# is only moved in place once it is verified and its manifest written, so when the
+# cache is warm a single stat call is enough. Archives given with --placeholder_path or
+# left by older versions are verified once, and the result is recorded with their size
+# and mtime in `<cache>/sources.json`. Extracted trees are only used once their files match
+# the manifest of the verified released archive, otherwise the archive is used instead.
+# Templates are read from the archive directly, without extracting it, using
+# `<archive>::<member>` paths understood by ``load_templates``.
+
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+import logging
+
+from clutrr.store.template_store import file_sha256, ARCHIVE_SEP
+
+logger = logging.getLogger()
+
+PLACEHOLDER_ZIP = 'cleaned_placeholders.zip'
+# sha of the placeholder files
+SHA_SUM = 'ed2264836bb17fe094dc21fe6bb7492b000df520eb86f8e60b8441121f8ff924'
+download_url = "https://cs.mcgill.ca/~ksinha4/data/"
+# template file prefix inside the archive, `.json`, `.train.json` or `.test.json` is appended
+TEMPLATE_MEMBER = 'cleaned_placeholders/amt_placeholders_clean'
+TEMPLATE_NAME = 'amt_placeholders_clean'
+
+
+def default_cache_dir(base_path):
+    return os.path.join(os.environ.get('CLUTRR_CACHE', os.path.join(base_path, '.clutrr_cache')), 'placeholders')
+
+
+def archive_manifest(path, sha, source):
+    """
+    Hash every file of an archive
+    :param path: zip file
+    :param sha: sha256 of the zip file
+    :param source: where the archive comes from
+    :return: manifest dict
+    """
+    files = {}
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            digest = hashlib.sha256()
+            with zf.open(info) as fp:
+                for chunk in iter(lambda: fp.read(65536), b''):
+                    digest.update(chunk)
+            files[info.filename] = digest.hexdigest()
+    return {'sha256': sha, 'source': source, 'size': os.path.getsize(path), 'files': files}
+
+
+def template_prefix(path):
+    """
+    Template file prefix inside an archive
+    :param path: zip file
+    :return: member prefix, eg ``cleaned_placeholders/amt_placeholders_clean``
+    """
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            base = name.rsplit('/', 1)[-1]
+            if base.startswith(TEMPLATE_NAME) and base.endswith('.json'):
+                return name[:len(name) - len(base)] + TEMPLATE_NAME
+    raise AssertionError("no {} json file found in {}".format(TEMPLATE_NAME, path))
+
+
+class PlaceholderCache:
+    """
+    Content addressed store of placeholder archives
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def zip_path(self, sha):
+        return os.path.join(self.cache_dir, '{}.zip'.format(sha))
+
+    def manifest_path(self, sha):
+        return os.path.join(self.cache_dir, '{}.json'.format(sha))
+
+    def sources_path(self):
+        return os.path.join(self.cache_dir, 'sources.json')
+
+    def get(self, sha):
+        """
+        Cached archive with the given sha, None if it is not in the cache
+        :param sha:
+        :return:
+        """
+        path = self.zip_path(sha)
+        return path if os.path.exists(path) else None
+
+    def manifest(self, sha):
+        with open(self.manifest_path(sha)) as fp:
+            return json.load(fp)
+
+    def add(self, path, source, expected_sha=None, move=False):
+        """
+        Verify an archive, write its manifest and store it in the cache
+        :param path: zip file
+        :param source: where the archive comes from, recorded in the manifest
+        :param expected_sha: if given, the sha256 the archive must have
+        :param move: move the file instead of copying it
+        :return: sha256, path of the cached archive
+        """
+        sha = file_sha256(path)
+        if expected_sha is not None and sha != expected_sha:
+            raise AssertionError("placeholder data {} is corrupt, sha256 doesn't match".format(source))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = archive_manifest(path, sha, source)
+        tmp_path = '{}.{}.tmp'.format(self.manifest_path(sha), os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump(manifest, fp, indent=1)
+        os.replace(tmp_path, self.manifest_path(sha))
+        tmp_path = '{}.{}.tmp'.format(self.zip_path(sha), os.getpid())
+        if move:
+            shutil.move(path, tmp_path)
+        else:
+            shutil.copyfile(path, tmp_path)
+        # the archive appears last, so that its presence means it is verified
+        os.replace(tmp_path, self.zip_path(sha))
+        return sha, self.zip_path(sha)
+
+    def download(self, url, expected_sha):
+        """
+        Download an archive into the cache
+        :param url:
+        :param expected_sha:
+        :return: path of the cached archive
+        """
+        import requests
+        os.makedirs(self.cache_dir, exist_ok=True)
+        print("Downloading placeholder data")
+        r = requests.get(url)
+        r.raise_for_status()
+        tmp_path = os.path.join(self.cache_dir, 'download.{}.tmp'.format(os.getpid()))
+        with open(tmp_path, 'wb') as f:
+            f.write(r.content)
+        try:
+            sha, path = self.add(tmp_path, url, expected_sha=expected_sha, move=True)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        print("Data valid, sha256 : {}".format(sha))
+        return path
+
+    def verify_source(self, path):
+        """
+        sha256 of an archive outside of the cache, computed once per size and mtime
+        :param path: zip file
+        :return: sha256
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        sources = {}
+        if os.path.exists(self.sources_path()):
+            with open(self.sources_path()) as fp:
+                sources = json.load(fp)
+        stamp = [st.st_size, st.st_mtime_ns]
+        if path in sources and sources[path][:2] == stamp:
+            return sources[path][2]
+        sha = file_sha256(path)
+        sources[path] = stamp + [sha]
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self.sources_path(), os.getpid())
+            with open(tmp_path, 'w') as fp:
+                json.dump(sources, fp, indent=1)
+            os.replace(tmp_path, self.sources_path())
+        except OSError:
+            pass
+        return sha
+
+    def released_manifest(self):
+        """
+        :return: manifest of the released archive, None if it was never verified
+        """
+        if self.get(SHA_SUM) is None:
+            return None
+        return self.manifest(SHA_SUM)
+
+    def verify_tree(self, directory, manifest):
+        """
+        Check the template files of an extracted tree against the hashes of an archive
+        manifest. The result is recorded with the size and mtime of the files, so a tree
+        is hashed again only when it changes
+        :param directory: folder holding the ``amt_placeholders_clean`` json files
+        :param manifest: see ``archive_manifest``
+        :return: True if all the template files of the archive are in the folder with the same content
+        """
+        members = {name: digest for name, digest in manifest['files'].items()
+                   if name.rsplit('/', 1)[-1].startswith(TEMPLATE_NAME)}
+        paths = {name: os.path.join(directory, name.rsplit('/', 1)[-1]) for name in members}
+        if not members or not all(os.path.isfile(path) for path in paths.values()):
+            return False
+        stamp = [manifest['sha256']] + [[os.stat(paths[name]).st_size, os.stat(paths[name]).st_mtime_ns]
+                                        for name in sorted(members)]
+        key = 'tree:' + os.path.abspath(directory)
+        sources = {}
+        if os.path.exists(self.sources_path()):
+            with open(self.sources_path()) as fp:
+                sources = json.load(fp)
+        if sources.get(key) == stamp:
+            return True
+        if any(file_sha256(paths[name]) != digest for name, digest in members.items()):
+            return False
+        sources[key] = stamp
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self.sources_path(), os.getpid())
+            with open(tmp_path, 'w') as fp:
+                json.dump(sources, fp, indent=1)
+            os.replace(tmp_path, self.sources_path())
+        except OSError:
+            pass
+        return True
+
+
+def tree_prefix(directory):
+    """
+    Template file prefix of an extracted tree, checking that its json files exist
+    :param directory:
+    :return: prefix
+    """
+    prefix = os.path.join(directory, TEMPLATE_NAME)
+    if not os.path.exists(prefix + '.json') and not (os.path.exists(prefix + '.train.json')
+                                                     and os.path.exists(prefix + '.test.json')):
+        raise AssertionError("{} does not contain the {} json files".format(directory, TEMPLATE_NAME))
+    return prefix
+
+
+def resolve_placeholders(base_path, placeholder_path=None, cache_dir=None):
+    """
+    Locate the placeholder templates, downloading them only if they are not available locally
+    :param base_path: root folder of the repository
+    :param placeholder_path: archive or extracted folder given by the user
+    :param cache_dir: cache folder, default ``placeholders`` in ``$CLUTRR_CACHE`` or ``<base_path>/.clutrr_cache``
+    :return: template file prefix, to use as ``args.template_file``
+    """
+    cache = PlaceholderCache(cache_dir or default_cache_dir(base_path))
+    if placeholder_path:
+        if os.path.isdir(placeholder_path):
+            # extracted tree, check it against the released archive when it was verified
+            prefix = tree_prefix(placeholder_path)
+            manifest = cache.released_manifest()
+            if manifest is None:
+                logger.warning("{} can not be verified without the released placeholder archive, "
+                               "using it as is".format(placeholder_path))
+                return prefix
+            if cache.verify_tree(placeholder_path, manifest):
+                return prefix
+            logger.warning("{} does not match the released placeholder archive, using the verified archive".format(
+                placeholder_path))
+            return cache.get(SHA_SUM) + ARCHIVE_SEP + TEMPLATE_MEMBER
+        sha = cache.verify_source(placeholder_path)
+        if sha != SHA_SUM:
+            logger.warning("{} is not the released placeholder archive (sha256 {})".format(placeholder_path, sha))
+        return os.path.abspath(placeholder_path) + ARCHIVE_SEP + template_prefix(placeholder_path)
+    path = cache.get(SHA_SUM)
+    if path is not None:
+        return path + ARCHIVE_SEP + TEMPLATE_MEMBER
+    # archive downloaded and extracted by an older version
+    legacy_path = os.path.join(base_path, PLACEHOLDER_ZIP)
+    if os.path.exists(legacy_path) and cache.verify_source(legacy_path) == SHA_SUM:
+        sha, path = cache.add(legacy_path, legacy_path, expected_sha=SHA_SUM)
+        return path + ARCHIVE_SEP + TEMPLATE_MEMBER
+    legacy_dir = os.path.join(base_path, 'clutrr', os.path.dirname(TEMPLATE_MEMBER))
+    try:
+        path = cache.download(download_url + PLACEHOLDER_ZIP, SHA_SUM)
+    except OSError as e:
+        # the extracted tree of an older version can not be verified without the archive
+        if not os.path.isdir(legacy_dir):
+            raise
+        logger.warning("placeholder archive not available ({}), using the unverified extracted placeholders "
+                       "in {}".format(e, legacy_dir))
+        return tree_prefix(legacy_dir)
+    return path + ARCHIVE_SEP + TEMPLATE_MEMBER
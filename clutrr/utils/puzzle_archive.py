@@ -0,0 +1,195 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Compact archive of the full puzzles, written by `--store_full_puzzles`
+# Puzzles of the same gender flip state share one ancestry snapshot, which is stored once:
+# its relations and the name, gender and attributes of each actor, without the store, the
+# random stream or the taken names. A puzzle record only holds its edges, proof trace, facts
+# and the index of its state. Records are zlib compressed pickles of plain python values.
+# Layout of `puzzles.clz`:
+#   MAGIC | relations store record | state and puzzle records | index record | index offset, size | MAGIC
+# The index maps each puzzle id to its record, so puzzles are read and rebuilt into
+# `Puzzle` objects one at a time:
+#   archive = PuzzleArchive('puzzles.clz')
+#   puzzle = archive[pid]
+
+import os
+import zlib
+import struct
+import pickle as pkl
+from collections import OrderedDict
+
+PUZZLE_ARCHIVE = 'puzzles.clz'
+MAGIC = b'CLUTRRPZ\x01'
+# number of ancestry states kept in memory by the reader
+STATE_CACHE = 64
+
+
+def _record(value):
+    return zlib.compress(pkl.dumps(value, protocol=4))
+
+
+def _state_record(anc):
+    nodes = {node_id: (actor.name, actor.gender, getattr(actor, 'attributes', {}))
+             for node_id, actor in anc.family_data.items()}
+    return {'family': anc.family, 'nodes': nodes, 'flipped': list(anc.flipped)}
+
+
+def _puzzle_record(puzzle, state):
+    return {
+        'id': puzzle.id,
+        'state': state,
+        'target_edge': puzzle.target_edge,
+        'story': puzzle.story,
+        'proof': puzzle.proof_trace,
+        'query_edge': puzzle.query_edge,
+        'facts': [(fact.fact_type, fact.fact_edges) for fact in puzzle.facts],
+        'story_sort_dict': puzzle.story_sort_dict,
+    }
+
+
+class PuzzleArchiveWriter:
+    """
+    Append puzzles to a compact archive
+    """
+    def __init__(self, path, relations_obj):
+        """
+
+        :param path: archive file
+        :param relations_obj: relations store of the puzzles, saved once in the archive
+        """
+        self.path = path
+        self.fp = open(path, 'wb')
+        self.fp.write(MAGIC)
+        self.states = {}  # id of the ancestry snapshot -> state index
+        self.state_offsets = []  # (offset, size) of each state record
+        self.index = {}  # pid -> (offset, size) of the puzzle record
+        self.relations = self._write(relations_obj)
+        # the snapshots are referenced until close, so that their ids are not reused
+        self.snapshots = []
+
+    def _write(self, value):
+        data = _record(value)
+        offset = self.fp.tell()
+        self.fp.write(data)
+        return offset, len(data)
+
+    def add(self, puzzle):
+        anc = puzzle.anc
+        if id(anc) not in self.states:
+            self.states[id(anc)] = len(self.state_offsets)
+            self.state_offsets.append(self._write(_state_record(anc)))
+            self.snapshots.append(anc)
+        self.index[puzzle.id] = self._write(_puzzle_record(puzzle, self.states[id(anc)]))
+
+    def close(self):
+        offset, size = self._write({'relations': self.relations, 'states': self.state_offsets, 'puzzles': self.index})
+        self.fp.write(struct.pack('<QQ', offset, size) + MAGIC)
+        self.fp.close()
+        self.snapshots = []
+
+
+def write_puzzles(path, puzzles, relations_obj):
+    """
+    Save puzzles into a compact archive
+    :param path:
+    :param puzzles: iterable of Puzzle
+    :param relations_obj: relations store of the puzzles
+    :return: number of ancestry states stored
+    """
+    writer = PuzzleArchiveWriter(path, relations_obj)
+    for puzzle in puzzles:
+        writer.add(puzzle)
+    num_states = len(writer.state_offsets)
+    writer.close()
+    return num_states
+
+
+class PuzzleArchive:
+    """
+    Random access to the puzzles of an archive by id
+    Puzzles are rebuilt on access, with an ancestry snapshot holding the relations and the actors
+    of their state, which is shared by the puzzles of the same state
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, 'rb')
+        if self.fp.read(len(MAGIC)) != MAGIC:
+            raise AssertionError("{} is not a puzzle archive".format(path))
+        self.fp.seek(-(16 + len(MAGIC)), os.SEEK_END)
+        footer = self.fp.read(16 + len(MAGIC))
+        if footer[16:] != MAGIC:
+            raise AssertionError("puzzle archive {} is incomplete".format(path))
+        index = self._read(*struct.unpack('<QQ', footer[:16]))
+        self.relations_obj = self._read(*index['relations'])
+        self.state_offsets = index['states']
+        self.index = index['puzzles']
+        self.states = OrderedDict()  # state index -> (Ancestry, edge relation table)
+
+    def _read(self, offset, size):
+        self.fp.seek(offset)
+        return pkl.loads(zlib.decompress(self.fp.read(size)))
+
+    def _state(self, state):
+        if state in self.states:
+            self.states.move_to_end(state)
+            return self.states[state]
+        from clutrr.actors.ancestry import Ancestry
+        from clutrr.actors.actor import Actor
+        record = self._read(*self.state_offsets[state])
+        anc = Ancestry.__new__(Ancestry)
+        anc.family = record['family']
+        anc.flipped = record['flipped']
+        anc.family_data = {}
+        for node_id, (name, gender, attributes) in record['nodes'].items():
+            actor = Actor.__new__(Actor)
+            actor.name, actor.gender, actor.node_id, actor.attributes = name, gender, node_id, attributes
+            anc.family_data[node_id] = actor
+        edge_rels = {}
+        for edge, rel in anc.family.items():
+            relation = rel.get('family')
+            if relation in self.relations_obj:
+                edge_rels[edge] = self.relations_obj[relation][anc.family_data[edge[1]].gender]
+        self.states[state] = (anc, edge_rels)
+        if len(self.states) > STATE_CACHE:
+            self.states.popitem(last=False)
+        return anc, edge_rels
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, pid):
+        return pid in self.index
+
+    def ids(self):
+        return list(self.index.keys())
+
+    def __getitem__(self, pid):
+        """
+        :param pid: puzzle id
+        :return: Puzzle
+        """
+        from clutrr.relations.puzzle import Puzzle
+        record = self._read(*self.index[pid])
+        anc, edge_rels = self._state(record['state'])
+        puzzle = Puzzle(id=record['id'], target_edge=record['target_edge'], story=record['story'],
+                        proof=record['proof'], query_edge=record['query_edge'], ancestry=anc,
+                        relations_obj=self.relations_obj, edge_rels=edge_rels)
+        for fact_type, fact_edges in record['facts']:
+            puzzle.add_fact(fact_type, fact_edges)
+        puzzle.derive_vals()
+        puzzle.story_sort_dict = record['story_sort_dict']
+        return puzzle
+
+    def __iter__(self):
+        for pid in self.index:
+            yield self[pid]
+
+    def close(self):
+        self.fp.close()
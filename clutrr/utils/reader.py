@@ -0,0 +1,302 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Random access to the rows of a dataset file, without loading it
+# A sidecar `<file>.idx` holds the byte offset of each row, the row ids and the rows of each
+# pattern. The data file is memory-mapped, so a row is read by position in O(1), by id in
+# O(log n) without loading the ids, and the rows of a pattern are read without parsing the others:
+#   reader = DatasetReader('data_xx/1.3_train.csv')
+#   row = reader[pid]
+#   batch = reader.sample(32)
+#   rows = reader.rows_of('son-daughter-wife')
+# The index is written at generation time with `--row_index`, or built on first use and
+# rebuilt when the data file changes. Only uncompressed csv and jsonl files can be indexed.
+# Layout : MAGIC | header length | pickled header | row offsets | pattern rows | id hashes |
+# id hash rows | id offsets | ids. The id hashes are sorted, with the row of each hash, and
+# the id of a matched row is compared, so that hash collisions are resolved.
+# Csv values are returned as strings, like in the file, jsonl values with their json types.
+
+import os
+import csv
+import io
+import json
+import mmap
+import array
+import bisect
+import hashlib
+import random
+import struct
+import pickle as pkl
+
+MAGIC = b'CLTRROW2'
+HEADER = struct.Struct('<8sQ')
+INDEX_EXT = '.idx'
+ID_COL = 'id'
+PATTERN_COL = 'f_comb'
+
+
+def index_path(path):
+    return path + INDEX_EXT
+
+
+def _file_format(path):
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith('.jsonl'):
+        return 'jsonl'
+    raise AssertionError("{} can not be indexed, only uncompressed csv and jsonl files are supported".format(path))
+
+
+def _id_hash(row_id):
+    return int.from_bytes(hashlib.blake2b(row_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _csv_records(fp):
+    """
+    Byte ranges of the csv records of a file, a record spans several lines if a quoted
+    field contains a line break
+    :param fp: file opened in binary mode
+    :return: iterator of (offset, record bytes)
+    """
+    offset = 0
+    start = 0
+    record = []
+    quotes = 0
+    for line in fp:
+        record.append(line)
+        quotes += line.count(b'"')
+        offset += len(line)
+        if quotes % 2 == 0:
+            yield start, b''.join(record)
+            start = offset
+            record = []
+            quotes = 0
+
+
+def build_row_index(path, out_path=None):
+    """
+    Scan a dataset file and write its row index
+    :param path: csv or jsonl dataset file
+    :param out_path: default ``<path>.idx``
+    :return: path of the index
+    """
+    fmt = _file_format(path)
+    out_path = out_path or index_path(path)
+    offsets = array.array('q')
+    ids = []
+    pattern_rows = {}
+    columns = None
+    with open(path, 'rb') as fp:
+        if fmt == 'csv':
+            records = _csv_records(fp)
+            try:
+                _, header = next(records)
+            except StopIteration:
+                header = b''
+            columns = next(csv.reader(io.StringIO(header.decode('utf-8'))), [])
+            id_pos, pattern_pos = columns.index(ID_COL), columns.index(PATTERN_COL)
+            for offset, record in records:
+                values = next(csv.reader(io.StringIO(record.decode('utf-8'))))
+                offsets.append(offset)
+                ids.append(values[id_pos])
+                pattern_rows.setdefault(values[pattern_pos], array.array('q')).append(len(offsets) - 1)
+        else:
+            offset = 0
+            for line in fp:
+                if line.strip():
+                    values = json.loads(line)
+                    if columns is None:
+                        columns = list(values.keys())
+                    offsets.append(offset)
+                    ids.append(values[ID_COL])
+                    pattern_rows.setdefault(values[PATTERN_COL], array.array('q')).append(len(offsets) - 1)
+                offset += len(line)
+        end = fp.tell()
+    offsets.append(end)
+    num_rows = len(offsets) - 1
+    rows = array.array('q')
+    patterns = {}
+    for pattern, pattern_pos in pattern_rows.items():
+        patterns[pattern] = (len(rows), len(pattern_pos))
+        rows.extend(pattern_pos)
+    # sorted (hash, row) table of the ids
+    id_hashes = array.array('Q')
+    hash_rows = array.array('q')
+    for id_hash, i in sorted((_id_hash(row_id), i) for i, row_id in enumerate(ids)):
+        id_hashes.append(id_hash)
+        hash_rows.append(i)
+    id_offsets = array.array('q', [0])
+    id_data = []
+    for row_id in ids:
+        id_data.append(row_id.encode('utf-8'))
+        id_offsets.append(id_offsets[-1] + len(id_data[-1]))
+    id_data = b''.join(id_data)
+    header = pkl.dumps({
+        'source': _source_key(path), 'format': fmt, 'columns': columns, 'num_rows': num_rows,
+        'patterns': patterns, 'offsets_size': len(offsets) * offsets.itemsize,
+        'rows_size': len(rows) * rows.itemsize, 'id_hashes_size': len(id_hashes) * id_hashes.itemsize,
+        'hash_rows_size': len(hash_rows) * hash_rows.itemsize,
+        'id_offsets_size': len(id_offsets) * id_offsets.itemsize, 'ids_size': len(id_data),
+    }, protocol=pkl.HIGHEST_PROTOCOL)
+    tmp_path = '{}.{}.tmp'.format(out_path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, len(header)))
+        fp.write(header)
+        offsets.tofile(fp)
+        rows.tofile(fp)
+        id_hashes.tofile(fp)
+        hash_rows.tofile(fp)
+        id_offsets.tofile(fp)
+        fp.write(id_data)
+    # atomic, so that concurrent readers never see a partial index
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class DatasetReader:
+    """
+    Memory-mapped, indexed rows of a csv or jsonl dataset file
+    """
+    def __init__(self, path, build=True):
+        """
+
+        :param path: dataset file
+        :param build: if True, build the index if it is missing or stale
+        """
+        self.path = path
+        self.format = _file_format(path)
+        idx_path = index_path(path)
+        if build and not self._valid_index(idx_path):
+            build_row_index(path, idx_path)
+        with open(idx_path, 'rb') as fp:
+            self._idx = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = HEADER.unpack_from(self._idx, 0)
+        if magic != MAGIC:
+            raise AssertionError("{} is not a row index".format(idx_path))
+        header = pkl.loads(self._idx[HEADER.size:HEADER.size + header_len])
+        if header['source'] != _source_key(path):
+            raise AssertionError("row index {} is stale, rebuild it".format(idx_path))
+        self.columns = header['columns']
+        self.num_rows = header['num_rows']
+        self._patterns = header['patterns']
+        base = HEADER.size + header_len
+        self._offsets = memoryview(self._idx)[base:base + header['offsets_size']].cast('q')
+        base += header['offsets_size']
+        self._rows = memoryview(self._idx)[base:base + header['rows_size']].cast('q')
+        base += header['rows_size']
+        self._id_hashes = memoryview(self._idx)[base:base + header['id_hashes_size']].cast('Q')
+        base += header['id_hashes_size']
+        self._hash_rows = memoryview(self._idx)[base:base + header['hash_rows_size']].cast('q')
+        base += header['hash_rows_size']
+        self._id_offsets = memoryview(self._idx)[base:base + header['id_offsets_size']].cast('q')
+        base += header['id_offsets_size']
+        self._ids_start = base
+        with open(path, 'rb') as fp:
+            self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+    def _valid_index(self, idx_path):
+        if not os.path.exists(idx_path):
+            return False
+        with open(idx_path, 'rb') as fp:
+            magic, header_len = HEADER.unpack(fp.read(HEADER.size))
+            if magic != MAGIC:
+                return False
+            return pkl.loads(fp.read(header_len))['source'] == _source_key(self.path)
+
+    def __len__(self):
+        return self.num_rows
+
+    def row(self, i):
+        """
+        :param i: position of the row in the file
+        :return: dict column -> value
+        """
+        record = self._data[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+        if self.format == 'jsonl':
+            return json.loads(record)
+        return dict(zip(self.columns, next(csv.reader(io.StringIO(record)))))
+
+    def ids(self):
+        return [self.row_id(i) for i in range(self.num_rows)]
+
+    def row_id(self, i):
+        """
+        :param i: position of the row in the file
+        :return: id of the row
+        """
+        start = self._ids_start
+        return self._idx[start + self._id_offsets[i]:start + self._id_offsets[i + 1]].decode('utf-8')
+
+    def position(self, pid):
+        """
+        Binary search of the id hash in the index
+        :param pid: row id
+        :return: position of the row in the file
+        """
+        id_hash = _id_hash(pid)
+        k = bisect.bisect_left(self._id_hashes, id_hash)
+        while k < len(self._id_hashes) and self._id_hashes[k] == id_hash:
+            if self.row_id(self._hash_rows[k]) == pid:
+                return self._hash_rows[k]
+            k += 1
+        raise KeyError(pid)
+
+    def __getitem__(self, pid):
+        return self.row(self.position(pid))
+
+    def __contains__(self, pid):
+        try:
+            self.position(pid)
+        except KeyError:
+            return False
+        return True
+
+    def patterns(self):
+        """
+        :return: dict pattern -> number of rows
+        """
+        return {pattern: count for pattern, (_, count) in self._patterns.items()}
+
+    def rows_of(self, pattern):
+        """
+        Rows of a pattern, in file order
+        :param pattern: f_comb of the rows
+        :return: iterator of dicts
+        """
+        start, count = self._patterns.get(pattern, (0, 0))
+        for i in self._rows[start:start + count]:
+            yield self.row(i)
+
+    def sample(self, num, rng=random):
+        """
+        Random minibatch of rows
+        :param num: number of rows, at most the number of rows of the file
+        :param rng: random stream
+        :return: list of dicts
+        """
+        return [self.row(i) for i in rng.sample(range(self.num_rows), min(num, self.num_rows))]
+
+    def __iter__(self):
+        for i in range(self.num_rows):
+            yield self.row(i)
+
+    def close(self):
+        self._offsets.release()
+        self._rows.release()
+        self._id_hashes.release()
+        self._hash_rows.release()
+        self._id_offsets.release()
+        self._idx.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
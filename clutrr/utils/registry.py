@@ -0,0 +1,126 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Persistent registry of the train / test patterns of the generated datasets
+# Patterns are stored in a SQLite file, keyed by (dataset, relation length, split, pattern),
+# so that `--unique_test_pattern` can restrict a test set to the test patterns recorded by
+# another process or an earlier run. Recording is a union, concurrent runs can share a file.
+#
+#   python registry.py <registry file>               : list the recorded pattern sets
+#   python registry.py <registry file> --dataset d   : print the patterns of a dataset
+
+import argparse
+import sqlite3
+
+SPLITS = ('train', 'test')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patterns (
+    dataset TEXT NOT NULL,
+    relation_length INTEGER NOT NULL,
+    split TEXT NOT NULL,
+    pattern TEXT NOT NULL,
+    PRIMARY KEY (dataset, relation_length, split, pattern)
+) WITHOUT ROWID
+"""
+
+
+class PatternRegistry:
+    """
+    SQLite file of the patterns per dataset, relation length and split
+    A connection is opened per call, so the registry can be used from forked processes
+    """
+    def __init__(self, path, timeout=60):
+        """
+
+        :param path: registry file, created if needed
+        :param timeout: seconds to wait for the lock of another writer
+        """
+        self.path = path
+        self.timeout = timeout
+        conn = self._connect()
+        with conn:
+            conn.execute(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def record(self, dataset, relation_length, train_patterns=(), test_patterns=()):
+        """
+        Add the patterns of a generated task
+        :param dataset: dataset name
+        :param relation_length:
+        :param train_patterns:
+        :param test_patterns:
+        :return:
+        """
+        rows = [(dataset, int(relation_length), split, pattern)
+                for split, patterns in zip(SPLITS, (train_patterns, test_patterns)) for pattern in patterns]
+        conn = self._connect()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO patterns VALUES (?, ?, ?, ?)', rows)
+        conn.close()
+
+    def patterns(self, dataset, relation_length, split='test'):
+        """
+        :param dataset:
+        :param relation_length:
+        :param split: train / test
+        :return: set of patterns
+        """
+        conn = self._connect()
+        rows = conn.execute('SELECT pattern FROM patterns WHERE dataset = ? AND relation_length = ? AND split = ?',
+                            (dataset, int(relation_length), split)).fetchall()
+        conn.close()
+        return set(row[0] for row in rows)
+
+    def contains(self, dataset, relation_length, pattern, split='test'):
+        """
+        Indexed lookup of a single pattern
+        :return: bool
+        """
+        conn = self._connect()
+        row = conn.execute('SELECT 1 FROM patterns WHERE dataset = ? AND relation_length = ? AND split = ? '
+                           'AND pattern = ?', (dataset, int(relation_length), split, pattern)).fetchone()
+        conn.close()
+        return row is not None
+
+    def unique_patterns(self, dataset, relation_length):
+        """
+        Recorded patterns in the format of ``Clutrr.unique_patterns``
+        :return: dict split -> set of patterns
+        """
+        return {split: self.patterns(dataset, relation_length, split) for split in SPLITS}
+
+    def summary(self):
+        """
+        :return: list of (dataset, relation length, split, number of patterns)
+        """
+        conn = self._connect()
+        rows = conn.execute('SELECT dataset, relation_length, split, COUNT(*) FROM patterns '
+                            'GROUP BY dataset, relation_length, split ORDER BY dataset, relation_length, split').fetchall()
+        conn.close()
+        return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=str, help='Registry file')
+    parser.add_argument("--dataset", type=str, default=None, help='Print the patterns of this dataset')
+    args = parser.parse_args()
+    registry = PatternRegistry(args.path)
+    for dataset, relation_length, split, num in registry.summary():
+        if args.dataset is None:
+            print("{} : length {}, {} : {} patterns".format(dataset, relation_length, split, num))
+        elif dataset == args.dataset:
+            print("length {}, {} :".format(relation_length, split))
+            for pattern in sorted(registry.patterns(dataset, relation_length, split)):
+                print("  {}".format(pattern))
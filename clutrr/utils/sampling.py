@@ -0,0 +1,124 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Group-wise sampling of dataset rows, eg to prepare MTurk batches
+# Rows are read chunk by chunk and kept in one fixed size reservoir per group, so a file
+# is sampled in a single pass, with memory bounded by the number of groups. Groups are
+# defined by any combination of:
+#   f_comb          : relation pattern of the story
+#   relation_length : number of relations in the story
+#   genders         : genders of the entities, in node order, eg female-male-female
+
+import ast
+import random
+
+GROUP_KEYS = ('f_comb', 'relation_length', 'genders')
+
+
+def _gender_combination(genders):
+    return '-'.join(node.rsplit(':', 1)[1] for node in genders.split(','))
+
+
+def _relation_length(f_comb, edge_types):
+    # the relations of the story edges come first in edge_types, before the ones of the noise
+    # facts, and make up f_comb : count them rather than split f_comb, relation names can hold a '-'
+    if isinstance(edge_types, str):
+        edge_types = ast.literal_eval(edge_types)
+    size = -1
+    for length, relation in enumerate(edge_types, 1):
+        size += len(relation) + 1
+        if size == len(f_comb) and '-'.join(edge_types[:length]) == f_comb:
+            return length
+    raise AssertionError("the relations {} do not start with the pattern {}".format(edge_types, f_comb))
+
+
+def group_keys(df, keys):
+    """
+    Group key of each row of a frame
+    :param df: DataFrame
+    :param keys: list of GROUP_KEYS
+    :return: list of tuples
+    """
+    columns = []
+    for key in keys:
+        if key == 'f_comb':
+            columns.append(df['f_comb'].tolist())
+        elif key == 'relation_length':
+            columns.append([_relation_length(f_comb, edge_types)
+                            for f_comb, edge_types in zip(df['f_comb'], df['edge_types'])])
+        elif key == 'genders':
+            columns.append([_gender_combination(genders) for genders in df['genders']])
+        else:
+            raise AssertionError("unknown group key {}, expected one of {}".format(key, GROUP_KEYS))
+    return list(zip(*columns))
+
+
+class GroupSampler:
+    """
+    Uniform sample of ``num`` rows per group, over a stream of frames
+    """
+    def __init__(self, keys=('f_comb',), num=1, seed=None):
+        """
+
+        :param keys: group keys, see GROUP_KEYS
+        :param num: rows to keep per group, groups with less rows are kept entirely
+        :param seed: seed of the sampling
+        """
+        self.keys = list(keys)
+        self.num = num
+        self.rng = random.Random(seed)
+        self.reservoirs = {}  # group -> list of row positions, groups in order of first row
+        self.seen = {}  # group -> number of rows
+        self.position = 0
+        self.candidates = []  # frames of the rows which were in a reservoir
+
+    def update(self, df):
+        """
+        Add the rows of a chunk
+        :param df: DataFrame
+        :return:
+        """
+        start = self.position
+        for pos, key in enumerate(group_keys(df, self.keys), start):
+            seen = self.seen.get(key, 0)
+            self.seen[key] = seen + 1
+            if seen < self.num:
+                self.reservoirs.setdefault(key, []).append(pos)
+            else:
+                j = self.rng.randrange(seen + 1)
+                if j < self.num:
+                    self.reservoirs[key][j] = pos
+        self.position += len(df)
+        kept = self.kept()
+        local = [pos - start for pos in range(start, self.position) if pos in kept]
+        self.candidates = [frame[frame['_pos'].isin(kept)] for frame in self.candidates]
+        if local:
+            frame = df.iloc[local].copy()
+            frame['_pos'] = [start + i for i in local]
+            self.candidates.append(frame)
+
+    def kept(self):
+        return set(pos for positions in self.reservoirs.values() for pos in positions)
+
+    def result(self):
+        """
+        Sampled rows, group by group in the order of their first row, then in file order
+        :return: DataFrame, None if no rows were added
+        """
+        import pandas as pd
+        order = {}
+        for positions in self.reservoirs.values():
+            for pos in sorted(positions):
+                order[pos] = len(order)
+        if not self.candidates:
+            return None
+        df = pd.concat(self.candidates)
+        df = df[df['_pos'].isin(order)]
+        df = df.assign(_order=df['_pos'].map(order)).sort_values('_order', kind='stable')
+        return df.drop(columns=['_pos', '_order'])
@@ -0,0 +1,51 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Hierarchical seeding
+# Every component which needs randomness receives its own random.Random stream, derived
+# from the root ``--seed`` and a path, eg (seed, 'task_1.3', 0.8, 'shard', 2).
+# Streams only depend on their path, so the output does not depend on the number
+# of worker processes or on the order in which shards are scheduled.
+
+import random
+import hashlib
+import uuid
+
+
+def derive_seed(seed, *path):
+    """
+    Derive a 64 bit seed for the given path from the root seed
+    :param seed: root seed
+    :param path: hashable path components, eg task name and shard id
+    :return: int
+    """
+    key = repr((seed,) + tuple(path)).encode('utf-8')
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], 'little')
+
+
+def make_rng(seed, *path):
+    """
+    Random stream for the given path
+    If seed is None, the stream is seeded from system entropy as before
+    :param seed: root seed, or None
+    :param path:
+    :return: random.Random
+    """
+    if seed is None:
+        return random.Random()
+    return random.Random(derive_seed(seed, *path))
+
+
+def random_id(rng):
+    """
+    uuid4 style id drawn from the given stream, deterministic for seeded streams
+    :param rng: random.Random
+    :return: str
+    """
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
@@ -0,0 +1,178 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Assign puzzles to the train / test split while they are generated
+# OnlineSplitter follows the generation order. HashSplitPlanner decides from a keyed hash
+# of the pattern (and puzzle id), so the split of a pattern does not depend on the order
+# in which patterns are generated, and can be computed by any shard or run on its own.
+
+import hashlib
+
+from clutrr.utils.seeding import derive_seed
+
+
+class OnlineSplitter:
+    """
+    Decide the split of each puzzle as soon as it is generated, without waiting for
+    the full set of puzzles. Follows the same policy as ``generate_rows``:
+
+    - holdout : split on pattern level, a new pattern goes to train as long as the
+      train patterns are below ``int(n * split)`` of the n patterns seen so far
+    - no holdout : all patterns are used in train. Patterns are marked as test patterns
+      with the same rule, and puzzles of test patterns are split with a train
+      ratio of ``split - 0.2``. As in ``generate_rows``, the train count of a test pattern
+      is rounded down, ``int(n * (split - 0.2))`` after its n-th puzzle, so the first
+      puzzle of a test pattern goes to test
+
+    The number of test patterns and the train / test counts of each test pattern are the same
+    as in ``generate_rows``.
+    The test patterns are spread over the generation order instead of being the last ones
+    found, since the number of patterns is not known while streaming.
+    """
+    def __init__(self, split=0.8, holdout=False):
+        """
+
+        :param split: ratio of train patterns
+        :param holdout: if True, no pattern overlap between train and test
+        """
+        self.split = split
+        self.holdout = holdout
+        self.puzzle_split = max(split - 0.2, 0.0)
+        self.pattern_split = {}  # pattern -> train / test
+        self.pattern_counts = {}  # pattern -> [num train, num total]
+        self.num_train_patterns = 0
+
+    def _assign_pattern(self, pattern):
+        if pattern not in self.pattern_split:
+            if self.num_train_patterns < int((len(self.pattern_split) + 1) * self.split):
+                self.pattern_split[pattern] = 'train'
+                self.num_train_patterns += 1
+            else:
+                self.pattern_split[pattern] = 'test'
+            self.pattern_counts[pattern] = [0, 0]
+        return self.pattern_split[pattern]
+
+    def assign(self, pattern, pid=None):
+        """
+        Assign a puzzle to a split
+        :param pattern: relation combination of the puzzle
+        :param pid: puzzle id
+        :return: train / test
+        """
+        pattern_split = self._assign_pattern(pattern)
+        counts = self.pattern_counts[pattern]
+        if self.holdout or pattern_split == 'train':
+            task_split = pattern_split
+        elif counts[0] < int((counts[1] + 1) * self.puzzle_split):
+            task_split = 'train'
+        else:
+            task_split = 'test'
+        if task_split == 'train':
+            counts[0] += 1
+        counts[1] += 1
+        return task_split
+
+    @property
+    def train_patterns(self):
+        if not self.holdout:
+            return list(self.pattern_split.keys())
+        return [p for p, sp in self.pattern_split.items() if sp == 'train']
+
+    @property
+    def test_patterns(self):
+        return [p for p, sp in self.pattern_split.items() if sp == 'test']
+
+
+def hash_fraction(key, *values):
+    """
+    Stable keyed hash of the values, mapped to [0, 1)
+    :param key: bytes, at most 64
+    :param values: str / int components
+    :return: float
+    """
+    digest = hashlib.blake2b('\x1f'.join(str(val) for val in values).encode('utf-8'), key=key,
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'little') / 2 ** 64
+
+
+class HashSplitPlanner:
+    """
+    Same policy as ``OnlineSplitter``, with the decisions taken by a keyed hash with a
+    target ratio instead of the generation order:
+
+    - holdout : a pattern is a train pattern if its hash is below ``split``
+    - no holdout : all patterns are used in train, and a puzzle of a test pattern goes to
+      train if the hash of (pattern, puzzle id) is below ``split - 0.2``. The ratio of test
+      patterns is re-centred so that the expected test share of the rows is ``1 - split``,
+      as in the holdout mode: ``(1 - split) / (1.2 - split)`` instead of ``1 - split``,
+      whatever the number of puzzles per pattern
+
+    Each decision is O(1) and only depends on the key, so parallel workers and successive
+    runs agree on the split of every pattern and puzzle.
+    """
+    def __init__(self, split=0.8, holdout=False, key=0):
+        """
+
+        :param split: ratio of train patterns
+        :param holdout: if True, no pattern overlap between train and test
+        :param key: int key of the hash, eg derived from the seed
+        """
+        self.split = split
+        self.holdout = holdout
+        self.puzzle_split = max(split - 0.2, 0.0)
+        # a test pattern only sends 1 - puzzle_split of its puzzles to test
+        test_ratio = 1 - split if holdout else min((1 - split) / (1 - self.puzzle_split), 1.0)
+        self.pattern_threshold = 1 - test_ratio
+        self.key = key.to_bytes(8, 'little')
+        self.pattern_split = {}  # pattern -> train / test, patterns seen so far
+
+    def split_of_pattern(self, pattern):
+        """
+        :param pattern: relation combination
+        :return: train / test
+        """
+        if pattern not in self.pattern_split:
+            self.pattern_split[pattern] = 'train' if hash_fraction(self.key, pattern) < self.pattern_threshold \
+                else 'test'
+        return self.pattern_split[pattern]
+
+    def assign(self, pattern, pid=None):
+        """
+        Assign a puzzle to a split
+        :param pattern: relation combination of the puzzle
+        :param pid: puzzle id
+        :return: train / test
+        """
+        pattern_split = self.split_of_pattern(pattern)
+        if self.holdout or pattern_split == 'train':
+            return pattern_split
+        return 'train' if hash_fraction(self.key, pattern, pid) < self.puzzle_split else 'test'
+
+    @property
+    def train_patterns(self):
+        if not self.holdout:
+            return list(self.pattern_split.keys())
+        return [p for p, sp in self.pattern_split.items() if sp == 'train']
+
+    @property
+    def test_patterns(self):
+        return [p for p, sp in self.pattern_split.items() if sp == 'test']
+
+
+def make_splitter(args, split, holdout):
+    """
+    Split planner selected by ``--split_by``
+    :param args:
+    :param split: ratio of train patterns
+    :param holdout: if True, no pattern overlap between train and test
+    :return: OnlineSplitter or HashSplitPlanner
+    """
+    if args.split_by == 'hash':
+        return HashSplitPlanner(split=split, holdout=holdout, key=derive_seed(args.split_key, 'split'))
+    return OnlineSplitter(split=split, holdout=holdout)
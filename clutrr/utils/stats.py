@@ -0,0 +1,165 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Dataset statistics, collected while the rows are written
+# For each dataset file: token length histograms of the story and clean story, counts of
+# the relation patterns, targets and tasks, number of noise edges (by noise type when the
+# rows come from the generator) and gender balance of the entities. They are saved in the
+# `stats.json` sidecar of the dataset.
+# Tokens are counted with a regex which splits words, possessives and punctuation like
+# nltk's word_tokenize does on the generated stories, at a fraction of the cost.
+#
+# Existing datasets can be re-analyzed, one file per process:
+#   python stats.py <dataset folder> --workers 4
+
+import argparse
+import ast
+import json
+import os
+import re
+import multiprocessing as mp
+from collections import Counter
+
+from clutrr.utils.formats import dataset_files, read_frame
+
+STATS_FILE = 'stats.json'
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*|'\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    return len(TOKEN_RE.findall(text))
+
+
+def _as_list(val):
+    # csv files store the lists as python reprs
+    if isinstance(val, str):
+        return ast.literal_eval(val)
+    return list(val)
+
+
+def _length_stats(hist):
+    num = sum(hist.values())
+    if num == 0:
+        return {'min': None, 'max': None, 'mean': None, 'histogram': {}}
+    return {'min': min(hist), 'max': max(hist), 'mean': sum(k * v for k, v in hist.items()) / num,
+            'histogram': {str(k): hist[k] for k in sorted(hist)}}
+
+
+class DatasetStats:
+    """
+    Statistics of the rows of a dataset file, updated batch by batch
+    """
+    def __init__(self):
+        self.rows = 0
+        self.story_tokens = Counter()
+        self.clean_story_tokens = Counter()
+        self.patterns = Counter()
+        self.targets = Counter()
+        self.tasks = Counter()
+        self.noise_edges = 0
+        self.noise_types = Counter()
+        self.genders = Counter()
+
+    def update(self, columns):
+        """
+        Add a batch of rows
+        :param columns: mapping column -> values, eg a ColumnBuffer or a DataFrame. The
+            edge_noise column is optional
+        :return:
+        """
+        get = columns.column if hasattr(columns, 'column') else columns.__getitem__
+        for story, clean_story in zip(get('story'), get('clean_story')):
+            self.story_tokens[count_tokens(story)] += 1
+            self.clean_story_tokens[count_tokens(clean_story)] += 1
+        f_combs = list(get('f_comb'))
+        self.rows += len(f_combs)
+        self.patterns.update(f_combs)
+        self.targets.update(get('target'))
+        self.tasks.update(get('task_name'))
+        for f_comb, edge_types in zip(f_combs, get('edge_types')):
+            self.noise_edges += len(_as_list(edge_types)) - len(f_comb.split('-'))
+        for genders in get('genders'):
+            self.genders.update(node.rsplit(':', 1)[1] for node in genders.split(','))
+        if 'edge_noise' in columns.columns:
+            for edge_noise in get('edge_noise'):
+                self.noise_types.update(noise for noise in edge_noise if noise != 'story')
+
+    def merge(self, other):
+        self.rows += other.rows
+        for name in ('story_tokens', 'clean_story_tokens', 'patterns', 'targets', 'tasks', 'noise_types',
+                     'genders'):
+            getattr(self, name).update(getattr(other, name))
+        self.noise_edges += other.noise_edges
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'story_tokens': _length_stats(self.story_tokens),
+            'clean_story_tokens': _length_stats(self.clean_story_tokens),
+            'patterns': dict(self.patterns.most_common()),
+            'targets': dict(self.targets.most_common()),
+            'tasks': dict(self.tasks.most_common()),
+            'noise_edges': self.noise_edges,
+            'noise_types': dict(self.noise_types.most_common()),
+            'genders': dict(self.genders.most_common()),
+        }
+
+
+def write_stats(directory, stats):
+    """
+    Save the stats.json sidecar of a dataset
+    :param directory: dataset folder
+    :param stats: dict file name -> DatasetStats
+    :return: path of the sidecar
+    """
+    path = os.path.join(directory, STATS_FILE)
+    with open(path, 'w') as fp:
+        json.dump({fl_name: stats[fl_name].to_dict() for fl_name in sorted(stats)}, fp, indent=1)
+    return path
+
+
+def file_stats(path):
+    stats = DatasetStats()
+    stats.update(read_frame(path))
+    return os.path.basename(path), stats
+
+
+def analyze_directory(directory, workers=1):
+    """
+    Compute the statistics of the files of an existing dataset, and save them in its sidecar
+    :param directory: dataset folder
+    :param workers: number of processes, one file per process
+    :return: dict file name -> DatasetStats
+    """
+    files = dataset_files(directory)
+    if workers > 1 and len(files) > 1:
+        with mp.get_context('fork').Pool(min(workers, len(files))) as pool:
+            results = pool.map(file_stats, files)
+    else:
+        results = [file_stats(fl) for fl in files]
+    stats = dict(results)
+    write_stats(directory, stats)
+    return stats
+
+
+def load_stats(directory):
+    with open(os.path.join(directory, STATS_FILE)) as fp:
+        return json.load(fp)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", type=str, help='Dataset folder')
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help='Number of processes')
+    args = parser.parse_args()
+    for fl_name, fl_stats in analyze_directory(args.directory, workers=args.workers).items():
+        fl_stats = fl_stats.to_dict()
+        print("{} : {} rows, story tokens {} - {}, {} patterns".format(
+            fl_name, fl_stats['rows'], fl_stats['story_tokens']['min'], fl_stats['story_tokens']['max'],
+            len(fl_stats['patterns'])))
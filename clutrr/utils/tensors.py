@@ -0,0 +1,228 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Tensorized export of the story graphs
+# Each dataset file gets a folder `tensors/<file name>/` of .npy arrays in CSR layout,
+# which can be opened with `numpy.load(path, mmap_mode='r')`:
+#   edges        int32 (E, 2)  story and noise edges of all rows, with the node ids of `story_edges`
+#   edge_offsets int64 (N + 1) edges of row i are edges[edge_offsets[i]:edge_offsets[i + 1]]
+#   edge_types   int32 (E,)    relation id of each edge
+#   edge_noise   int8  (E,)    0 for story edges, else the noise type of the fact, see NOISE_TYPES
+#   query_edge   int32 (N, 2)
+#   target       int32 (N,)    relation id of the target
+#   genders      int8  (V,)    gender id of each node, see GENDERS
+#   node_offsets int64 (N + 1) nodes of row i are genders[node_offsets[i]:node_offsets[i + 1]]
+# Relation ids index the relations of `relations_store.yaml`, listed in `tensors/vocab.json`.
+# The arrays are appended batch by batch, their .npy header is rewritten with the final
+# shape when the file is closed. Numpy is only needed to read them.
+
+import os
+import sys
+import json
+import array
+import struct
+
+TENSOR_DIR = 'tensors'
+VOCAB_FILE = 'vocab.json'
+NOISE_TYPES = ('story', 'supporting', 'irrelevant', 'disconnected')
+GENDERS = ('male', 'female')
+# array name -> (array typecode, numpy type, shape of a row)
+ARRAYS = {
+    'edges': ('i', 'i4', (2,)),
+    'edge_offsets': ('q', 'i8', ()),
+    'edge_types': ('i', 'i4', ()),
+    'edge_noise': ('b', 'i1', ()),
+    'query_edge': ('i', 'i4', (2,)),
+    'target': ('i', 'i4', ()),
+    'genders': ('b', 'i1', ()),
+    'node_offsets': ('q', 'i8', ()),
+}
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# fixed header size, so that the header can be rewritten in place once the shape is known
+NPY_HEADER_SIZE = 128
+
+
+def relation_vocab(relations_store):
+    """
+    Relation names of the relations store, in file order
+    :param relations_store: parsed relations_store.yaml
+    :return: tuple of relation names
+    """
+    names = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, val in node.items():
+                if key == 'rel':
+                    if val not in names:
+                        names.append(val)
+                else:
+                    walk(val)
+    walk(relations_store)
+    return tuple(names)
+
+
+def npy_header(np_type, shape):
+    byte_order = '|' if np_type == 'i1' else ('<' if sys.byteorder == 'little' else '>')
+    header = "{{'descr': '{}{}', 'fortran_order': False, 'shape': {}, }}".format(byte_order, np_type, shape)
+    header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 3) + '\n'
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class NpyAppender:
+    """
+    .npy file written row by row
+    """
+    def __init__(self, path, typecode, np_type, row_shape=(), size=None):
+        """
+
+        :param path:
+        :param typecode: array module typecode of the values
+        :param np_type: numpy type, eg i4
+        :param row_shape: shape of a row, () for a 1-d array
+        :param size: if given, reopen an existing file truncated to this size in bytes
+        """
+        self.path = path
+        self.typecode = typecode
+        self.np_type = np_type
+        self.row_shape = tuple(row_shape)
+        self.row_values = 1
+        for dim in self.row_shape:
+            self.row_values *= dim
+        self.item_size = array.array(typecode).itemsize
+        if size is None:
+            self.fp = open(path, 'wb')
+            self.fp.write(npy_header(np_type, (0,) + self.row_shape))
+        else:
+            self.fp = open(path, 'r+b')
+            self.fp.truncate(size)
+            self.fp.seek(size)
+
+    def write(self, values):
+        """
+        :param values: array.array of the values, flattened
+        :return:
+        """
+        values.tofile(self.fp)
+
+    def size(self):
+        self.fp.flush()
+        return self.fp.tell()
+
+    def close(self):
+        num_rows = (self.size() - NPY_HEADER_SIZE) // (self.item_size * self.row_values)
+        self.fp.seek(0)
+        self.fp.write(npy_header(self.np_type, (num_rows,) + self.row_shape))
+        self.fp.close()
+
+
+class TensorWriter:
+    """
+    CSR arrays of the rows of a dataset file
+    """
+    def __init__(self, directory, relations, sizes=None):
+        """
+
+        :param directory: folder of the arrays
+        :param relations: relation vocabulary
+        :param sizes: if given, reopen the arrays truncated to these sizes, see ``state``
+        """
+        self.directory = directory
+        self.relation_ids = {rel: i for i, rel in enumerate(relations)}
+        self.noise_ids = {noise: i for i, noise in enumerate(NOISE_TYPES)}
+        self.gender_ids = {gender: i for i, gender in enumerate(GENDERS)}
+        os.makedirs(directory, exist_ok=True)
+        self.arrays = {name: NpyAppender(os.path.join(directory, name + '.npy'), typecode, np_type, row_shape,
+                                         size=sizes[name] if sizes else None)
+                       for name, (typecode, np_type, row_shape) in ARRAYS.items()}
+        if sizes:
+            self.num_edges, self.num_nodes = sizes['num_edges'], sizes['num_nodes']
+        else:
+            self.num_edges = self.num_nodes = 0
+            self.arrays['edge_offsets'].write(array.array('q', [0]))
+            self.arrays['node_offsets'].write(array.array('q', [0]))
+
+    def relation_id(self, rel):
+        if rel not in self.relation_ids:
+            raise AssertionError("relation {} is not in the relations store".format(rel))
+        return self.relation_ids[rel]
+
+    def write(self, part):
+        """
+        Append the rows of a partition
+        :param part: ColumnBuffer, with the edge_noise column
+        :return:
+        """
+        if len(part) == 0:
+            return
+        values = {name: array.array(typecode) for name, (typecode, _, _) in ARRAYS.items()}
+        for story_edges, edge_types, edge_noise, query_edge, target, genders in zip(
+                part.column('story_edges'), part.column('edge_types'), part.column('edge_noise'),
+                part.column('query_edge'), part.column('target'), part.column('genders')):
+            for a, b in story_edges:
+                values['edges'].extend((a, b))
+            values['edge_types'].extend(self.relation_id(rel) for rel in edge_types)
+            values['edge_noise'].extend(self.noise_ids[noise] for noise in edge_noise)
+            self.num_edges += len(story_edges)
+            values['edge_offsets'].append(self.num_edges)
+            values['query_edge'].extend(query_edge)
+            values['target'].append(self.relation_id(target))
+            node_genders = [self.gender_ids[node.rsplit(':', 1)[1]] for node in genders.split(',')]
+            values['genders'].extend(node_genders)
+            self.num_nodes += len(node_genders)
+            values['node_offsets'].append(self.num_nodes)
+        for name, vals in values.items():
+            self.arrays[name].write(vals)
+
+    def state(self):
+        sizes = {name: arr.size() for name, arr in self.arrays.items()}
+        sizes.update(num_edges=self.num_edges, num_nodes=self.num_nodes)
+        return sizes
+
+    def close(self):
+        for arr in self.arrays.values():
+            arr.close()
+
+
+def write_vocab(directory, relations):
+    with open(os.path.join(directory, TENSOR_DIR, VOCAB_FILE), 'w') as fp:
+        json.dump({'relations': list(relations), 'genders': list(GENDERS), 'noise_types': list(NOISE_TYPES)}, fp)
+
+
+class TensorDataset:
+    """
+    Zero-copy random access to the exported graphs of a dataset file
+    """
+    def __init__(self, directory, mmap_mode='r'):
+        """
+
+        :param directory: `tensors/<file name>` folder of a dataset
+        :param mmap_mode: passed to numpy.load
+        """
+        import numpy as np
+        self.arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                       for name in ARRAYS}
+        with open(os.path.join(os.path.dirname(os.path.normpath(directory)), VOCAB_FILE)) as fp:
+            self.vocab = json.load(fp)
+
+    def __len__(self):
+        return len(self.arrays['target'])
+
+    def __getitem__(self, i):
+        arrays = self.arrays
+        e0, e1 = arrays['edge_offsets'][i], arrays['edge_offsets'][i + 1]
+        n0, n1 = arrays['node_offsets'][i], arrays['node_offsets'][i + 1]
+        return {
+            'edges': arrays['edges'][e0:e1],
+            'edge_types': arrays['edge_types'][e0:e1],
+            'edge_noise': arrays['edge_noise'][e0:e1],
+            'query_edge': arrays['query_edge'][i],
+            'target': arrays['target'][i],
+            'genders': arrays['genders'][n0:n1],
+        }
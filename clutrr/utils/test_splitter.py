@@ -9,16 +9,87 @@
 
 # Split the test files into their own task specific files
 # Not required in actual data generation
-import pandas as pd
+# Each combined test file (eg `1.2,1.3_test.csv`) is read once, chunk by chunk, and its
+# rows are routed to one file per task. The task files are written under temporary names (`*_test.tmp.csv`)
+# and moved in place once complete, then config.json is replaced atomically, and finally
+# the combined files are renamed to `*_backupt*`. The checksums of the config are refreshed to the split
+# files, so that `--reuse` still finds the dataset. Dataset folders are processed in parallel.
 import os
 import glob
 import json
 import argparse
+import multiprocessing as mp
+
+from clutrr.utils.fingerprint import file_checksums
+from clutrr.utils.formats import dataset_files, iter_frames, FrameAppender
+
+
+def split_test_file(folder, test_file, chunksize=100000):
+    """
+    Route the rows of a combined test file into per task files
+    :param folder: dataset folder
+    :param test_file: path of the combined test file
+    :param chunksize: number of rows read at once
+    :return: dict task name (eg 1.2) -> file name of its test file
+    """
+    test_fl_name = os.path.basename(test_file)
+    ext = test_fl_name[test_fl_name.index('_test') + len('_test'):]
+    writers = {}
+    try:
+        for df in iter_frames(test_file, chunksize=chunksize):
+            for task, dft in df.groupby('task_name', sort=False):
+                tname = task.split('task_')[-1]
+                if tname not in writers:
+                    writers[tname] = FrameAppender(os.path.join(folder, '{}_test.tmp{}'.format(tname, ext)))
+                writers[tname].write(dft)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    task_files = {}
+    for tname, writer in writers.items():
+        flname = '{}_test{}'.format(tname, ext)
+        os.replace(writer.path, os.path.join(folder, flname))
+        task_files[tname] = flname
+    return task_files
+
+
+def split_folder(folder):
+    """
+    Split the combined test files of a dataset folder and update its config
+    :param folder:
+    :return: number of test files split
+    """
+    with open(os.path.join(folder, 'config.json')) as fp:
+        config = json.load(fp)
+    # get splittable test files
+    test_files = [t for t in dataset_files(folder, '*_test') if len(os.path.basename(t).split(',')) > 1]
+    for test_file in test_files:
+        test_fl_name = os.path.basename(test_file)
+        for tname, flname in split_test_file(folder, test_file).items():
+            config['args'][flname] = config['args'][test_fl_name]
+            # test_tasks keeps the combined file the task was generated in, test_files the split file
+            config['test_tasks'][tname] = test_fl_name
+            config.setdefault('test_files', {})[tname] = flname
+        del config['args'][test_fl_name]
+    # checksums of the folder as it is once the combined test files are backed up
+    backups = {os.path.relpath(t, folder): os.path.relpath(t.replace('_test', '_backupt'), folder) for t in test_files}
+    checksums = {backups.get(rel_path, rel_path): digest for rel_path, digest in file_checksums(folder).items()}
+    config['checksums'] = {rel_path: checksums[rel_path] for rel_path in sorted(checksums)}
+    tmp_path = os.path.join(folder, 'config.json.tmp')
+    with open(tmp_path, 'w') as fp:
+        json.dump(config, fp)
+    os.replace(tmp_path, os.path.join(folder, 'config.json'))
+    # backup the original test_files
+    for test_file in test_files:
+        os.rename(test_file, test_file.replace('_test', '_backupt'))
+    return len(test_files)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     # graph parameters
     parser.add_argument("--data_folder", default='data_emnlp', type=str, help="data folder")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int, help="number of folders split in parallel")
     args = parser.parse_args()
     base_path = os.path.abspath(os.path.join(os.pardir, os.pardir))
     print(base_path)
@@ -27,27 +98,7 @@ if __name__ == '__main__':
     dirs = [dir for dir in dirs if os.path.isdir(dir)]
     print("Found {} directories".format(len(dirs)))
     print(dirs)
-    for folder in dirs:
-        # read config file
-        config = json.load(open(os.path.join(folder, 'config.json')))
-        # get test_file
-        test_files = glob.glob(os.path.join(folder, '*_test.csv'))
-        # get splittable test files
-        test_files = [t for t in test_files if len(t.split(',')) > 1]
-        for test_file in test_files:
-            df = pd.read_csv(test_file)
-            test_fl_name = test_file.split('/')[-1]
-            tasks = df.task_name.unique()
-            for task in tasks:
-                dft = df[df.task_name == task]
-                tname = task.split('task_')[-1]
-                flname = tname + '_test.csv'
-                dft.to_csv(os.path.join(folder, flname))
-                config['args'][flname] = config['args'][test_fl_name]
-                config['test_tasks'][tname] = test_fl_name
-            del config['args'][test_fl_name]
-        json.dump(config, open(os.path.join(folder, 'config.json'),'w'))
-        # backup the original test_files
-        for test_file in test_files:
-            os.rename(test_file, test_file.replace('_test','_backupt'))
+    with mp.Pool(max(1, min(args.workers, len(dirs)))) as pool:
+        for folder, num_files in zip(dirs, pool.imap(split_folder, dirs)):
+            print("{} : split {} test files".format(folder, num_files))
     print("splitting done")
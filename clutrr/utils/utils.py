@@ -8,10 +8,9 @@
 """
 
 import itertools as it
-import numpy as np
 import csv
-import pandas as pd
 import random
+from functools import lru_cache
 
 
 def pairwise(iterable):
@@ -34,6 +33,7 @@ def prob_dist(rows):
     return rel_probs
 
 def split_train_test(args, rows):
+    import numpy as np
     # split training testing
     r1 = prob_dist(rows)
     indices = range(len(rows))
@@ -61,6 +61,7 @@ def write2file(args, rows, filename):
             writer.writerow(row)
 
 def sanity_check(filename, rows):
+    import pandas as pd
     ## sanity check
     df = pd.read_csv(filename, skip_blank_lines=True, comment='#')
     print('Total rows : {}'.format(len(df)))
@@ -135,4 +136,17 @@ def comb_indexes(sn, max_seq_len=3):
     return pairs
 
 def choose_random_subsequence(sn, max_seq_len=3):
-    return random.choice(comb_indexes(sn, max_seq_len))
\ No newline at end of file
+    return random.choice(comb_indexes(sn, max_seq_len))
+
+@lru_cache(maxsize=None)
+def comb_index_groups(n, max_seq_len=3):
+    """
+    Cached version of ``comb_indexes`` over the positions 0..n-1
+    The combinations only depend on the length of the sequence, so they are
+    computed once and re-used for every story of the same length
+    :param n: length of the sequence
+    :param max_seq_len:
+    :return: tuple of combinations, each a tuple of groups of positions
+    """
+    return tuple(tuple(tuple(group) for group in comb)
+                 for comb in comb_indexes(list(range(n)), max_seq_len))
@@ -0,0 +1,353 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# Write partitioned rows into the dataset files
+# Train rows of all tasks go to the train file, test rows go to the file of their
+# test task. Rows can be written in one go or appended batch by batch, in any of the
+# output formats of ``clutrr.utils.formats``.
+# Batches can be handed over to a background thread through a bounded queue, so that
+# formatting, disk writes and compression overlap with the generation. Each file is
+# deflated while it is written, and the zip archive of the dataset is assembled from the
+# compressed data at the end instead of re-reading and compressing the files again.
+
+import os
+import copy
+import zlib
+import queue
+import shutil
+import zipfile
+import tempfile
+import threading
+
+from clutrr.utils.columnar import ColumnBuffer
+from clutrr.utils.formats import encode, ParquetFileWriter, EXTENSIONS
+from clutrr.utils.tensors import TensorWriter, TENSOR_DIR, write_vocab
+from clutrr.utils.stats import DatasetStats, write_stats
+
+
+class ArchiveMember:
+    """
+    Raw deflate stream of a file, spooled to a temporary file
+    """
+    def __init__(self, directory):
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.spool = tempfile.TemporaryFile(dir=directory)
+        self.crc = 0
+        self.file_size = 0
+
+    def write(self, data):
+        self.spool.write(self.compressor.compress(data))
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+
+    def finish(self):
+        self.spool.write(self.compressor.flush())
+        self.spool.flush()
+        compress_size = self.spool.tell()
+        self.spool.seek(0)
+        return compress_size
+
+    def close(self):
+        self.spool.close()
+
+
+class ArchiveStream:
+    """
+    Zip archive of a dataset folder, built while its files are written
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.members = {}  # file name -> ArchiveMember, in the order of first write
+
+    def write(self, fl_name, data):
+        if fl_name not in self.members:
+            self.members[fl_name] = ArchiveMember(self.directory)
+        self.members[fl_name].write(data)
+
+    def discard(self, fl_name=None):
+        """
+        Drop the compressed data of a file, or of all files
+        :param fl_name:
+        :return:
+        """
+        for name in ([fl_name] if fl_name is not None else list(self.members)):
+            if name in self.members:
+                self.members.pop(name).close()
+
+    def reload(self, fl_name, path, buf_size=1 << 20):
+        """
+        Compress a file again from its content on disk, eg after it was truncated
+        :param fl_name:
+        :param path:
+        :param buf_size:
+        :return:
+        """
+        self.discard(fl_name)
+        self.members[fl_name] = ArchiveMember(self.directory)
+        with open(path, 'rb') as fp:
+            for data in iter(lambda: fp.read(buf_size), b''):
+                self.members[fl_name].write(data)
+
+    def close(self, zip_path):
+        """
+        Write the archive, with the streamed files followed by the other files of the folder
+        and of its sub folders, eg ``tensors/``
+        :param zip_path:
+        :return:
+        """
+        tmp_path = '{}.{}.tmp'.format(zip_path, os.getpid())
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for fl_name, member in self.members.items():
+                zinfo = zipfile.ZipInfo.from_file(os.path.join(self.directory, fl_name), fl_name)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                zinfo.CRC = member.crc
+                zinfo.file_size = member.file_size
+                zinfo.compress_size = member.finish()
+                zinfo.header_offset = zf.fp.tell()
+                # the data is already deflated, copy it after the local header
+                zip64 = max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT
+                zf.fp.write(zinfo.FileHeader(zip64))
+                shutil.copyfileobj(member.spool, zf.fp)
+                zf.filelist.append(zinfo)
+                zf.NameToInfo[fl_name] = zinfo
+                zf.start_dir = zf.fp.tell()
+            for root, dirs, files in os.walk(self.directory):
+                # sorted walk, so that the archive does not depend on the listing order
+                dirs.sort()
+                for fl in sorted(files):
+                    path = os.path.join(root, fl)
+                    fl_name = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                    if fl_name not in self.members:
+                        zf.write(path, fl_name)
+        os.replace(tmp_path, zip_path)
+        self.discard()
+
+
+class DatasetWriter:
+    """
+    Route the partitions of ColumnarRows into the csv files of a dataset folder
+    """
+    def __init__(self, directory, columns, train_file, test_files, queue_size=0, archive=True,
+                 output_format='csv', compression='', row_group_size=50000, relations=None):
+        """
+
+        :param directory: dataset folder
+        :param columns: output columns
+        :param train_file: file name of the train file
+        :param test_files: dict task_name -> file name of the test file
+        :param queue_size: if > 0, batches are written by a background thread, at most
+            ``queue_size`` batches wait in its queue
+        :param archive: compress the files while they are written, see ``write_archive``
+        :param output_format: csv, jsonl or parquet
+        :param compression: gzip for csv / jsonl, parquet codec for parquet (default snappy)
+        :param row_group_size: number of rows per parquet row group
+        :param relations: relation vocabulary, if given the story graphs are also exported as
+            .npy arrays, see ``clutrr.utils.tensors``
+        """
+        self.directory = directory
+        self.output_format = output_format
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self._parquet = {}  # file name -> ParquetFileWriter
+        self.relations = relations
+        self._tensors = {}  # file name -> TensorWriter
+        self.stats = {}  # file name -> DatasetStats
+        self.columns = list(columns)
+        self.train_file = train_file
+        self.test_files = test_files
+        self.num_rows = {}  # file name -> rows written
+        self.counts = {'train': 0, 'test': 0}
+        self.archive = ArchiveStream(directory) if archive else None
+        self._queue = None
+        self._thread = None
+        self._error = None
+        if queue_size > 0:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._run, name='DatasetWriter', daemon=True)
+            self._thread.start()
+
+    def route(self, task_split, task_name):
+        """
+        Output file of a partition, None if the partition is not stored
+        :param task_split:
+        :param task_name:
+        :return:
+        """
+        if task_split == 'train':
+            return self.train_file
+        return self.test_files.get(task_name)
+
+    def path(self, fl_name):
+        return os.path.join(self.directory, fl_name)
+
+    def tensor_path(self, fl_name):
+        stem = fl_name.split(EXTENSIONS[self.output_format])[0]
+        return os.path.join(self.directory, TENSOR_DIR, stem)
+
+    def _append(self, fl_name, part, start):
+        """
+        Append a partition to a file
+        :param fl_name:
+        :param part: ColumnBuffer
+        :param start: index of the first row in the file, the header is written if 0
+        :return:
+        """
+        if start == 0:
+            self.stats[fl_name] = DatasetStats()
+        self.stats[fl_name].update(part)
+        if self.relations is not None:
+            if start == 0:
+                if fl_name in self._tensors:
+                    self._tensors.pop(fl_name).close()
+                self._tensors[fl_name] = TensorWriter(self.tensor_path(fl_name), self.relations)
+            self._tensors[fl_name].write(part)
+        if self.output_format == 'parquet':
+            # parquet files are written by pyarrow, and added to the archive at the end
+            if start == 0:
+                if fl_name in self._parquet:
+                    self._parquet.pop(fl_name).close()
+                self._parquet[fl_name] = ParquetFileWriter(self.path(fl_name), self.columns, self.compression,
+                                                           self.row_group_size)
+            self._parquet[fl_name].write(part)
+            return
+        data = encode(self.output_format, self.columns, part, start, self.compression)
+        with open(self.path(fl_name), 'ab' if start > 0 else 'wb') as fp:
+            fp.write(data)
+        if self.archive is not None:
+            if start == 0:
+                self.archive.discard(fl_name)
+            self.archive.write(fl_name, data)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is not None and self._error is None:
+                    self._append(*item)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+            if item is None:
+                return
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError("writing {} failed".format(self.directory)) from self._error
+
+    def _submit(self, fl_name, part):
+        start = self.num_rows.get(fl_name, 0)
+        self.num_rows[fl_name] = start + len(part)
+        if self._queue is None:
+            self._append(fl_name, part, start)
+        else:
+            self._check()
+            # blocks when the queue is full, so that generation can't run ahead of the disk
+            self._queue.put((fl_name, part, start))
+
+    def flush(self):
+        """
+        Wait until the queued batches are written
+        :return:
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self._check()
+
+    def write(self, rows):
+        """
+        Append all partitions of the rows to their files
+        :param rows: ColumnarRows
+        :return: number of rows written
+        """
+        written = 0
+        for (task_split, task_name), part in rows.partitions.items():
+            fl_name = self.route(task_split, task_name)
+            if fl_name is None or len(part) == 0:
+                continue
+            self._submit(fl_name, part)
+            self.counts[task_split] += len(part)
+            written += len(part)
+        return written
+
+    def count(self, task_split):
+        return self.counts[task_split]
+
+    def state(self):
+        """
+        Rows and bytes written so far, see ``restore``
+        :return: dict
+        """
+        self.flush()
+        return {'num_rows': dict(self.num_rows), 'counts': dict(self.counts),
+                'sizes': {fl_name: os.path.getsize(self.path(fl_name)) for fl_name in self.num_rows},
+                'tensors': {fl_name: tensors.state() for fl_name, tensors in self._tensors.items()},
+                'stats': copy.deepcopy(self.stats)}
+
+    def restore(self, state):
+        """
+        Go back to a saved state, truncating the rows written after it
+        Files first written after the state are overwritten by the next write
+        :param state: dict returned by ``state``
+        :return:
+        """
+        self.flush()
+        for fl_name, size in state['sizes'].items():
+            with open(self.path(fl_name), 'r+b') as fp:
+                fp.truncate(size)
+        for tensors in self._tensors.values():
+            tensors.close()
+        self._tensors = {fl_name: TensorWriter(self.tensor_path(fl_name), self.relations, sizes=sizes)
+                         for fl_name, sizes in state.get('tensors', {}).items()}
+        if self.archive is not None:
+            self.archive.discard()
+            for fl_name in state['sizes']:
+                self.archive.reload(fl_name, self.path(fl_name))
+        self.num_rows = dict(state['num_rows'])
+        self.counts = dict(state['counts'])
+        self.stats = copy.deepcopy(state.get('stats', {}))
+
+    def close(self):
+        """
+        Wait for the queued batches and create the files which did not receive any rows,
+        with only the header
+        :return:
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = self._thread = None
+        self._check()
+        for fl_name in [self.train_file] + list(self.test_files.values()):
+            if fl_name not in self.num_rows:
+                self._append(fl_name, ColumnBuffer(self.columns, None, None), 0)
+                self.num_rows[fl_name] = 0
+        for writer in self._parquet.values():
+            writer.close()
+        self._parquet = {}
+        for tensors in self._tensors.values():
+            tensors.close()
+        self._tensors = {}
+        if self.relations is not None:
+            write_vocab(self.directory, self.relations)
+        write_stats(self.directory, self.stats)
+
+    def write_archive(self, zip_path=None):
+        """
+        Zip the dataset folder, once it is complete
+        Files written through the writer are stored from their compressed streams, other
+        files such as the config are compressed here
+        :param zip_path: default ``<directory>.zip``
+        :return: path of the archive
+        """
+        zip_path = zip_path or self.directory + '.zip'
+        if self.archive is None:
+            return shutil.make_archive(os.path.splitext(zip_path)[0], 'zip', self.directory)
+        self.archive.close(zip_path)
+        return zip_path
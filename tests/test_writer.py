@@ -0,0 +1,94 @@
+"""
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+#
+"""
+
+# ArchiveStream copies the deflate streams of the files into the zip archive with zipfile
+# internals, check that the archives it writes read back with the standard zipfile reader
+import os
+import struct
+import zipfile
+
+import pytest
+
+from clutrr.utils.writer import ArchiveStream
+
+
+def write_folder(directory, archive, sizes):
+    """
+    Write csv files both on disk and through the archive stream, and a tensors/ sub folder
+    only on disk
+    :return: dict member name -> content
+    """
+    contents = {}
+    for i, size in enumerate(sizes):
+        fl_name = '1.{}_test.csv'.format(i + 2)
+        data = b''.join('{},story {}\n'.format(row, row * 7).encode('utf-8') for row in range(size))
+        with open(os.path.join(directory, fl_name), 'wb') as fp:
+            fp.write(data)
+        # in chunks, like the writer
+        for start in range(0, len(data), 4096):
+            archive.write(fl_name, data[start:start + 4096])
+        contents[fl_name] = data
+    os.makedirs(os.path.join(directory, 'tensors'))
+    tensor = os.urandom(3000)
+    with open(os.path.join(directory, 'tensors', 'edges.npy'), 'wb') as fp:
+        fp.write(tensor)
+    contents['tensors/edges.npy'] = tensor
+    with open(os.path.join(directory, 'config.json'), 'w') as fp:
+        fp.write('{}')
+    contents['config.json'] = b'{}'
+    return contents
+
+
+def check_archive(zip_path, contents):
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(contents)
+        for name, data in contents.items():
+            assert zf.read(name) == data
+
+
+@pytest.mark.parametrize('zip64_limit', [None, 1 << 12])
+def test_archive_round_trip(tmp_path, monkeypatch, zip64_limit):
+    if zip64_limit is not None:
+        # members larger than the limit get zip64 headers, without writing gigabytes
+        monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', zip64_limit)
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    archive = ArchiveStream(str(directory))
+    contents = write_folder(str(directory), archive, [10, 5000])
+    zip_path = str(tmp_path / 'data.zip')
+    archive.close(zip_path)
+    if zip64_limit is not None:
+        with zipfile.ZipFile(zip_path) as zf:
+            zinfo = zf.getinfo('1.3_test.csv')
+            assert zinfo.file_size > zip64_limit
+            # the copied local header holds the zip64 sizes too
+            zf.fp.seek(zinfo.header_offset)
+            header = struct.unpack(zipfile.structFileHeader, zf.fp.read(zipfile.sizeFileHeader))
+            zf.fp.seek(header[zipfile._FH_FILENAME_LENGTH], os.SEEK_CUR)
+            extra = zf.fp.read(header[zipfile._FH_EXTRA_FIELD_LENGTH])
+            assert header[zipfile._FH_UNCOMPRESSED_SIZE] == 0xFFFFFFFF
+            assert struct.unpack('<HH', extra[:4])[0] == 1
+    check_archive(zip_path, contents)
+
+
+def test_archive_reload(tmp_path):
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    archive = ArchiveStream(str(directory))
+    contents = write_folder(str(directory), archive, [100])
+    # truncate the file, the archive is compressed again from the disk
+    path = os.path.join(str(directory), '1.2_test.csv')
+    with open(path, 'r+b') as fp:
+        fp.truncate(50)
+    archive.reload('1.2_test.csv', path)
+    contents['1.2_test.csv'] = contents['1.2_test.csv'][:50]
+    zip_path = str(tmp_path / 'data.zip')
+    archive.close(zip_path)
+    check_archive(zip_path, contents)